@@ -0,0 +1,208 @@
+'''
+Offline benchmarks of the fetch pipeline against the
+simulated Eikon backend. Run from the repository root:
+
+>>> python -m benchmarks.run --sizes 10 100 1000 --output benchmarks/results.json
+
+Every benchmark is run for every size (number of companies),
+and the results are written as JSON so that runs can be compared.
+'''
+
+from .simulated_eikon import SimulatedEikon
+from company import company_attributes
+from company.company import Company, get_source_attributes, get_years
+from coverage.analysis import analize_value_lists
+from metrics import MetricsEngine
+from refinitiv import api
+from refinitiv.rate_limit import TokenBucket
+from refinitiv.request import Request, formattable_period_str
+from values import Value
+from serialization import write_companies
+from datetime import datetime
+import argparse
+import io
+import json
+import platform
+import time
+import main
+import pipeline
+
+refinitiv_request_attributes = get_source_attributes(company_attributes, 'refinitiv')
+
+
+def get_identifiers(n):
+    return [f'SIM{i}.CO' for i in range(n)]
+
+
+def get_requests(identifiers, years):
+    # fetched in one batch, so only the parsing is measured by the benchmarks using it
+    return Request.batch(identifiers, refinitiv_request_attributes, years)
+
+
+def benchmark_get_companies(n, workers=None, batch_size=None):
+    identifiers = get_identifiers(n)
+    start = time.perf_counter()
+    main.get_companies(identifiers, workers=workers, batch_size=batch_size)
+
+    return time.perf_counter() - start
+
+
+def benchmark_pipeline(n, workers=None, batch_size=None):
+    identifiers = get_identifiers(n)
+    start = time.perf_counter()
+
+    for _ in pipeline.run_pipeline(identifiers, batch_size, workers or 1):
+        pass
+
+    return time.perf_counter() - start
+
+
+def benchmark_build_parameters(n):
+    years = get_years(10)
+    period_str = formattable_period_str.format(years[0], years[-1])
+    start = time.perf_counter()
+
+    for _ in range(n):
+        Request.build_parameters(refinitiv_request_attributes, period_str)
+
+    return time.perf_counter() - start
+
+
+def benchmark_build_response(n):
+    # the frame of a batch of n companies, parsed at once
+    years = get_years(10)
+    identifiers = get_identifiers(n)
+    df = Request.fetch_batch_df(identifiers, refinitiv_request_attributes, years)
+    start = time.perf_counter()
+    Request.from_batch_df(identifiers, refinitiv_request_attributes, years, df)
+
+    return time.perf_counter() - start
+
+
+def benchmark_parse_company_frame(n):
+    # the frame of a single company (about as many rows as years), parsed n times
+    years = get_years(10)
+    df = Request.fetch_df(get_identifiers(1)[0], refinitiv_request_attributes, years)
+    start = time.perf_counter()
+
+    for _ in range(n):
+        Request.from_df(refinitiv_request_attributes, years, df)
+
+    return time.perf_counter() - start
+
+
+def benchmark_to_dict(n):
+    requests = get_requests(get_identifiers(n), get_years(10))
+    companies = [Company(identifier, refinitiv_request=request) for identifier, request in requests.items()]
+    start = time.perf_counter()
+
+    for company in companies:
+        company.to_dict()
+
+    return time.perf_counter() - start
+
+
+def benchmark_write_companies(n):
+    requests = get_requests(get_identifiers(n), get_years(10))
+    companies = {identifier: Company(identifier, refinitiv_request=request) for identifier, request in requests.items()}
+    start = time.perf_counter()
+    write_companies(companies, io.StringIO())
+
+    return time.perf_counter() - start
+
+
+def benchmark_value_list_arithmetic(n):
+    requests = get_requests(get_identifiers(n), get_years(10))
+    value_lists = [(request.response['loan_losses'], request.response['total_revenues']) for request in requests.values()]
+    start = time.perf_counter()
+
+    for loan_losses, total_revenues in value_lists:
+        (loan_losses/total_revenues)*Value(100, '%')
+        loan_losses + total_revenues - loan_losses
+
+    return time.perf_counter() - start
+
+
+def benchmark_metrics(n):
+    requests = get_requests(get_identifiers(n), get_years(10))
+    companies = {identifier: Company(identifier, refinitiv_request=request) for identifier, request in requests.items()}
+    start = time.perf_counter()
+    engine = MetricsEngine(companies)
+    engine.evaluate(('product', ('ratio', 'loan_losses', 'total_revenues'), ('value', 100, '%')))
+    engine.evaluate(('growth', 'impairment_fixed_assets'))
+    engine.evaluate(('rolling_mean', 'total_revenues', 3))
+
+    return time.perf_counter() - start
+
+
+def benchmark_analize_value_lists(n):
+    requests = get_requests(get_identifiers(n), get_years(10))
+    companies = [Company(identifier, refinitiv_request=request) for identifier, request in requests.items()]
+    start = time.perf_counter()
+    analize_value_lists(companies)
+
+    return time.perf_counter() - start
+
+
+benchmarks = {
+    'get_companies': benchmark_get_companies,
+    'pipeline': benchmark_pipeline,
+    'build_parameters': benchmark_build_parameters,
+    'build_response': benchmark_build_response,
+    'parse_company_frame': benchmark_parse_company_frame,
+    'to_dict': benchmark_to_dict,
+    'write_companies': benchmark_write_companies,
+    'value_list_arithmetic': benchmark_value_list_arithmetic,
+    'metrics': benchmark_metrics,
+    'analize_value_lists': benchmark_analize_value_lists
+}
+
+
+def run_benchmarks(sizes, names=list(benchmarks), workers=None, batch_size=None):
+    results = []
+
+    for n in sizes:
+        for name in names:
+            if name in ['get_companies', 'pipeline']:
+                seconds = benchmarks[name](n, workers, batch_size)
+
+            else:
+                seconds = benchmarks[name](n)
+
+            results.append({'benchmark': name, 'companies': n, 'seconds': seconds, 'companies_per_second': n/seconds if seconds > 0 else None})
+            print(f'{name:<24}{n:>8} companies{seconds:>12.4f} s')
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='numbers of companies')
+    parser.add_argument('--benchmarks', nargs='+', default=list(benchmarks), choices=list(benchmarks))
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per simulated api call')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probability of a transient error per api call')
+    parser.add_argument('--segments', type=int, default=3, help='rows per fiscal year of value_map fields')
+    parser.add_argument('--rows-per-year', type=int, default=1, help='rows per fiscal year of value_list fields (restated values)')
+    parser.add_argument('--requests-per-second', type=float, default=1e9, help='rate limit of the simulated api')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--output', default='benchmarks/results.json')
+    args = parser.parse_args()
+
+    backend = SimulatedEikon(latency=args.latency, error_rate=args.error_rate, segments=args.segments, rows_per_year=args.rows_per_year)
+    api.set_backend(backend)
+    api.cache.enabled = False
+    api.limiter = TokenBucket(args.requests_per_second, burst=max(1, int(min(args.requests_per_second, 1e6))))
+
+    results = run_benchmarks(args.sizes, args.benchmarks, args.workers, args.batch_size)
+    output = {
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'api_calls': backend.calls,
+        'results': results
+    }
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(output, file, indent=4)
@@ -0,0 +1,180 @@
+'''
+A stand-in for the `eikon` module that produces synthetic 
+responses shaped like those of `eikon.get_data`, so the 
+fetch pipeline can be benchmarked without the Eikon proxy:
+
+>>> from refinitiv import api
+>>> api.set_backend(SimulatedEikon(latency=0.2, error_rate=0.01))
+'''
+
+from refinitiv import config
+import numpy as np
+import pandas as pd
+import re
+import threading
+import time
+
+period_pattern = re.compile(r'\(SDate=FY(\d+),EDate=FY(\d+)[^)]*\)')
+
+
+class SimulatedError(Exception):
+    '''
+    Raised by `SimulatedEikon` instead of `eikon.EikonError`, 
+    with a status code like the ones of the Eikon data api.
+    '''
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class SimulatedEikon:
+    '''
+    A simulated Eikon data api.
+
+    ...
+
+    Attributes
+    ----------
+    latency : float
+        seconds that every call takes
+    error_rate : float
+        probability that a call fails with a transient error
+    segments : int
+        number of segments of every `value_map` year
+    rows_per_year : int
+        number of rows of every `value_list` year (like 
+        restated values, of which the last one is used)
+    missing_rate : float
+        probability that a value is missing
+    calls : int
+        number of calls so far
+
+    Methods
+    -------
+    get_data(instruments, fields):
+        outputs a synthetic response
+    '''
+
+    def __init__(self, latency: float=0.0, error_rate: float=0.0, segments: int=3, rows_per_year: int=1, missing_rate: float=0.1, seed: int=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.segments = segments
+        self.rows_per_year = rows_per_year
+        self.missing_rate = missing_rate
+        self.calls = 0
+        self.random = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+
+    def get_data(self, instruments, fields, **kwargs):
+        '''
+        Outputs a synthetic response with an `Instrument` column 
+        and one column per field. Fields with a period get one row 
+        per fiscal year (times `segments` for `value_map`s and 
+        `rows_per_year` for `value_list`s), and 
+        fields without a period are only set in the first row.
+
+        Parameters
+        ----------
+        instruments : str or list
+            identifier(s) of the companies
+        fields : list
+            Refinitiv parameters
+
+        Returns
+        -------
+        tuple
+            `(pandas.DataFrame, None)` like `eikon.get_data`
+        '''
+
+        # the random generator is not thread-safe, so it is only used with the lock
+        with self.lock:
+            self.calls += 1
+            failed = self.random.random() < self.error_rate
+            code = 429 if self.random.random() < 0.5 else 503
+
+        time.sleep(self.latency)
+
+        if failed:
+            raise SimulatedError(code, 'simulated transient error')
+
+        if isinstance(instruments, str):
+            instruments = [instruments]
+
+        columns = [[] for _ in fields]
+        instrument_column = []
+        mapped = {get_base_field(field) for field in fields if field.endswith(config['name_str'])}
+        n_rows = 1
+
+        for field in fields:
+            years = get_years(field)
+
+            if years is not None:
+                n_rows = max(n_rows, len(years)*(self.segments if get_base_field(field) in mapped else self.rows_per_year))
+
+        with self.lock:
+            for instrument in instruments:
+                instrument_column += [instrument]*n_rows
+
+                for column, field in zip(columns, fields):
+                    column += self.get_column(instrument, field, n_rows, mapped)
+
+        df = pd.DataFrame({'Instrument': instrument_column})
+
+        for i, column in enumerate(columns):
+            df[f'Field {i}'] = column
+
+        return df, None
+
+    def get_column(self, instrument, field, n_rows, mapped):
+        years = get_years(field)
+        base_field = get_base_field(field)
+
+        if years is None:
+            if field == 'TR.RIC':
+                value = instrument
+
+            elif field == 'TR.CommonName':
+                value = f'{instrument} A/S'
+
+            elif field.endswith(tuple(config['unit_strs'].values())):
+                value = 'DKK'
+
+            else:
+                value = float(self.random.normal(1e9, 1e8))
+
+            return [value] + [None]*(n_rows-1)
+
+        years = np.repeat(years, self.segments if base_field in mapped else self.rows_per_year)
+
+        if field.endswith(config['date_str']):
+            column = [f'{year}-12-31' for year in years]
+
+        elif field.endswith(config['name_str']):
+            column = [f'Segment {i}' for i in range(self.segments)]*(len(years)//self.segments)
+
+        elif field.endswith(tuple(config['unit_strs'].values())):
+            column = ['DKK']*len(years)
+
+        else:
+            values = self.random.normal(1e9, 1e8, len(years)).round()
+            missing = self.random.random(len(years)) < self.missing_rate
+            column = [None if is_missing else value for value, is_missing in zip(values.tolist(), missing)]
+
+        return column + [None]*(n_rows-len(column))
+
+
+def get_years(field):
+    match = period_pattern.search(field)
+
+    if match is None:
+        return None
+
+    start, end = int(match.group(1)), int(match.group(2))
+
+    return list(range(start, end-1, -1))
+
+
+def get_base_field(field):
+    return period_pattern.split(field)[0]
@@ -1,4 +1,4 @@
 import json
 
-with open('company/company_attributes.json') as file:
+with open('company/company_attributes.json', encoding='utf-8') as file:
     company_attributes = json.load(file)
\ No newline at end of file
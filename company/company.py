@@ -1,9 +1,14 @@
 from . import company_attributes
-from values import Value, ValueList, get_unit
-import refinitiv.request
+from refinitiv import config
+from values import Value, ValueList, SegmentMap
+from instrumentation import recorder
 from datetime import datetime
+from time import perf_counter
 
 current_year = datetime.now().year
+# `(attribute_key, name, type)` of the attributes in `to_dict`, in the order of `company_attributes`
+serialized_attributes = [(attribute_key, attribute['name'], attribute['type']) for attribute_key, attribute in \
+    company_attributes.items() if not attribute_key.startswith('temp_')]
 
 
 class Company:
@@ -26,10 +31,12 @@ class Company:
         JSON serializable)
     value : Value
         an instance of the `Value` class
-    value_list : list
-        list of lists of `Value` objects
-    value_map : list
-        list of lists of `[GeoPlace, Value]`-type lists
+    value_list : ValueList
+        an instance of the `ValueList` class
+    value_map : SegmentMap
+        an instance of the `SegmentMap` class, which 
+        outputs a list of `(segment_name, Value)` 
+        tuples per year
     
     Each element in a `value_list` or `value_map` corresponds 
     to a year:
@@ -37,15 +44,28 @@ class Company:
 
     Methods
     -------
+    from_batch(identifiers, years_back, saved_companies):
+        (class method) initializes several companies from 
+        batched requests
+    from_dict(company_dict, lazy):
+        (class method) initializes a company from its 
+        `to_dict()` output without any requests
     set_empty_attributes(years):
         sets all attributes to an initial state (of `None`s)
     set_attributes(self, attributes_dict):
         sets the attributes as dictated by `attributes_dict`
+    set_saved_attributes(saved_company):
+        sets the attributes from a company saved in `companies.json`
+    merge_attributes(attributes_dict, years):
+        sets the attributes of the given years as dictated 
+        by `attributes_dict`
+    merge_ric_request(refinitiv_request):
+        merges the response of the deferred RIC request
     to_dict():
         converts the object into a JSON serializable `dict`
     '''
     
-    def __init__(self, identifier: str, years_back: int=10):
+    def __init__(self, identifier: str, years_back: int=10, refinitiv_request=None, saved_company=None, defer_ric_retry=False):
         '''
         Gathers all data on company.
 
@@ -57,36 +77,169 @@ class Company:
         years_back : int
             number of consecutive fiscal years to 
             be analyzed
+        refinitiv_request : refinitiv.request.Request
+            an already fetched request for the company 
+            (e.g. from a batch), if `None` a new request 
+            is sent
+        saved_company : dict
+            the company as saved in `companies.json`, if 
+            given only the missing or open fiscal years 
+            are requested and merged into the saved data
+        defer_ric_retry : bool
+            if `True`, the request with the RIC (when not much 
+            data was found) is not sent, but left in 
+            `self.pending_ric` for `retry_with_rics`
 
         Returns
         -------
         None
         '''
 
-        years = list(range(current_year, current_year-years_back-1, -1))
+        years = get_years(years_back)
+        self.pending_ric = None
         self.set_empty_attributes(years)
         self.years = years
+        request_years = get_request_years(years, saved_company)
+        self.request_years = request_years
+
+        if request_years != years:
+            self.set_saved_attributes(saved_company)
+
+        # imported here, so that working with saved companies does not load the api
+        from refinitiv.request import Request
 
         refinitiv_request_attributes = get_source_attributes(company_attributes, 'refinitiv')
-        refinitiv_request = refinitiv.request.Request(identifier, refinitiv_request_attributes, self.years)
+
+        if refinitiv_request is None:
+            refinitiv_request = Request(identifier, refinitiv_request_attributes, request_years)
 
         # sends a new refinitiv request with the RIC if not much data was found
         if (refinitiv_request.response is not None and
                 refinitiv_request.is_mostly_none() and
-                refinitiv_request.response['ric'] is not None):
-            refinitiv_request = refinitiv.request.Request(refinitiv_request.response['ric'], refinitiv_request_attributes, self.years)
+                refinitiv_request.response['ric'] not in [None, identifier]):
+            recorder.count('company.ric_fallbacks')
 
-        if refinitiv_request.response is None:
-            self.error = True
-            self.name = identifier
+            if defer_ric_retry:
+                self.pending_ric = refinitiv_request.response['ric']
 
-        else:
+            else:
+                refinitiv_request = Request(refinitiv_request.response['ric'], refinitiv_request_attributes, request_years)
+
+        if refinitiv_request.response is not None:
+            self.error = False
+            self.merge_attributes(refinitiv_request.response, refinitiv_request.years)
+
+        # keeps the saved data if the incremental request failed
+        elif request_years != years:
             self.error = False
-            self.set_attributes(refinitiv_request.response)
+
+        else:
+            recorder.count('company.errors')
+            self.error = True
+            self.name = identifier
             
     def __eq__(self, company):
         return self.__dict__ == company.__dict__
-            
+
+    @classmethod
+    def from_batch(cls, identifiers: list, years_back: int=10, saved_companies=None, rics=None, defer_ric_retry=False):
+        '''
+        Gathers all data on several companies with as 
+        few batched requests as possible (one per 
+        distinct range of requested years).
+
+        Parameters
+        ----------
+        identifiers : list
+            identifiers of the companies that can be 
+            recognized by the Eikon data api e.g. ISINs
+        years_back : int
+            number of consecutive fiscal years to 
+            be analyzed
+        saved_companies : dict
+            `dict` mapping identifiers to companies as saved 
+            in `companies.json` to be refreshed incrementally
+        rics : dict
+            `dict` mapping identifiers to the RICs that should 
+            be requested instead (see `retry_with_rics`)
+        defer_ric_retry : bool
+            passed on to each `Company`
+
+        Returns
+        -------
+        companies : dict
+            `dict` mapping each identifier to its `Company`
+        '''
+
+        years = get_years(years_back)
+        from refinitiv.request import Request
+
+        saved_companies = saved_companies or {}
+        rics = rics or {}
+        refinitiv_request_attributes = get_source_attributes(company_attributes, 'refinitiv')
+        batches = {}
+        refinitiv_requests = {}
+
+        for identifier in identifiers:
+            request_years = get_request_years(years, saved_companies.get(identifier))
+            batches.setdefault(tuple(request_years), []).append(rics.get(identifier, identifier))
+
+        for request_years, batch in batches.items():
+            refinitiv_requests.update(Request.batch(batch, refinitiv_request_attributes, list(request_years)))
+
+        companies = {identifier: cls(rics.get(identifier, identifier), years_back, refinitiv_requests[rics.get(identifier, identifier)], \
+            saved_companies.get(identifier), defer_ric_retry) for identifier in identifiers}
+
+        return companies
+
+    @classmethod
+    def from_dict(cls, company_dict: dict, lazy: bool=False):
+        '''
+        Initializes a company from a `dict` in the format of 
+        `companies.json` (the inverse of `to_dict`) without 
+        sending any requests.
+
+        Parameters
+        ----------
+        company_dict : dict
+            the company as saved in `companies.json`
+        lazy : bool
+            if `True`, attributes are only converted into 
+            `Value`, `ValueList` etc. when they are accessed
+
+        Returns
+        -------
+        company : Company
+        '''
+
+        company = cls.__new__(cls)
+        company.pending_ric = None
+        company.years = company_dict['years']['value']
+        company.request_years = company.years
+        company.error = company_dict['error']['value']
+
+        if lazy:
+            company.saved_company = company_dict
+            return company
+
+        for attribute_key in company_attributes:
+            if attribute_key not in ['error', 'years']:
+                company.__dict__[attribute_key] = get_attribute_from_dict(attribute_key, company_dict.get(attribute_key), company.years)
+
+        return company
+
+    def __getattr__(self, attribute_key):
+        # only called if the attribute is not set, i.e. not yet converted by a lazy `from_dict`
+        saved_company = self.__dict__.get('saved_company')
+
+        if saved_company is None or attribute_key not in company_attributes:
+            raise AttributeError(f"'Company' object has no attribute '{attribute_key}'")
+
+        attribute = get_attribute_from_dict(attribute_key, saved_company.get(attribute_key), self.years)
+        self.__dict__[attribute_key] = attribute
+
+        return attribute
+
     def set_empty_attributes(self, years):
         '''
         Sets all attributes equal to a None- or 
@@ -115,7 +268,7 @@ class Company:
                 self.__dict__[attribute_key] = ValueList([Value(None) for _ in years])
 
             elif attribute['type'] == 'value_map':
-                self.__dict__[attribute_key] = [[] for _ in years]
+                self.__dict__[attribute_key] = SegmentMap.empty(len(years))
 
     def set_attributes(self, attributes_dict):
         '''
@@ -136,6 +289,110 @@ class Company:
         for attribute_key, attribute in attributes_dict.items():
             self.__dict__[attribute_key] = attribute
 
+    def set_saved_attributes(self, saved_company):
+        '''
+        Sets the attributes from a company as saved in 
+        `companies.json`. The `value_list`s and `value_map`s 
+        are aligned to `self.years`, so years that were not 
+        saved are left empty.
+
+        Parameters
+        ----------
+        saved_company : dict
+            the company as saved in `companies.json`
+
+        Returns
+        -------
+        None
+        '''
+
+        saved_years = saved_company['years']['value']
+
+        for attribute_key, attribute in company_attributes.items():
+            if attribute_key in ['error', 'years'] or attribute_key not in saved_company:
+                continue
+
+            value = saved_company[attribute_key]['value']
+            unit = saved_company[attribute_key]['unit']
+
+            if attribute['type'] == 'other':
+                self.__dict__[attribute_key] = value
+
+            elif attribute['type'] == 'value':
+                self.__dict__[attribute_key] = Value(value, unit)
+
+            elif attribute['type'] == 'value_list':
+                for year, year_value in zip(saved_years, value):
+                    if year in self.years:
+                        self.__dict__[attribute_key][self.years.index(year)] = Value(year_value, unit)
+
+            elif attribute['type'] == 'value_map':
+                for year, tuples in zip(saved_years, value):
+                    if year in self.years:
+                        self.__dict__[attribute_key][self.years.index(year)] = [(name, Value(year_value, unit)) for name, year_value in tuples]
+
+    def merge_attributes(self, attributes_dict, years):
+        '''
+        Sets the attributes dictated by `attributes_dict` like 
+        `set_attributes`, except that the `value_list`s and 
+        `value_map`s of `attributes_dict` only cover `years`, 
+        so only those years are overwritten.
+
+        Parameters
+        ----------
+        attributes_dict : dict
+            `dict` to dictate the attributes
+        years : list
+            list of consecutive fiscal years covered 
+            by `attributes_dict`
+
+        Returns
+        -------
+        None
+        '''
+
+        if years == self.years:
+            self.set_attributes(attributes_dict)
+            return
+
+        for attribute_key, attribute in attributes_dict.items():
+            if company_attributes[attribute_key]['type'] not in ['value_list', 'value_map']:
+                self.__dict__[attribute_key] = attribute
+                continue
+
+            for year, year_attribute in zip(years, attribute):
+                if year in self.years:
+                    self.__dict__[attribute_key][self.years.index(year)] = year_attribute
+
+    def merge_ric_request(self, refinitiv_request):
+        '''
+        Merges the response of the request that was deferred 
+        with `defer_ric_retry` (see `pending_ric`).
+
+        Parameters
+        ----------
+        refinitiv_request : refinitiv.request.Request
+            request of `pending_ric`
+
+        Returns
+        -------
+        bool
+            whether the RIC gave more data
+        '''
+
+        found = False
+
+        if refinitiv_request.response is not None:
+            self.merge_attributes(refinitiv_request.response, refinitiv_request.years)
+
+            if not refinitiv_request.is_mostly_none():
+                recorder.count('company.ric_fallback_successes')
+                found = True
+
+        self.pending_ric = None
+
+        return found
+
     def to_dict(self):
         '''
         Outputs a `dict` that represents the company in 
@@ -149,39 +406,190 @@ class Company:
             `dict` of the attributes of the object
         '''
 
+        start = perf_counter()
         dict_ = {}
+        # attributes of a lazy `from_dict` that were never accessed are copied as saved
+        saved_company = self.__dict__.get('saved_company') or {}
 
-        for attribute_key in company_attributes:
-            if attribute_key.startswith('temp_'):
+        for attribute_key, name, type_ in serialized_attributes:
+            if attribute_key not in self.__dict__ and attribute_key in saved_company:
+                saved_attribute = saved_company[attribute_key]
+                dict_[attribute_key] = {'name': name, 'value': saved_attribute['value'], 'unit': saved_attribute['unit']}
                 continue
 
-            attribute = self.__getattribute__(attribute_key)
-            type_ = company_attributes[attribute_key]['type']
-            dict_[attribute_key] = {}
-            dict_[attribute_key]['name'] = company_attributes[attribute_key]['name']
+            attribute = getattr(self, attribute_key)
 
             if type_ == 'other':
-                dict_[attribute_key]['value'] = attribute
-                dict_[attribute_key]['unit'] = None
+                dict_[attribute_key] = {'name': name, 'value': attribute, 'unit': None}
 
             elif type_ == 'value':
-                dict_[attribute_key]['value'] = attribute.value
-                dict_[attribute_key]['unit'] = attribute.unit
-            
-            elif type_ == 'value_list':
-                unit = get_unit(attribute)
-                dict_[attribute_key]['value'] = [value.value for value in attribute]
-                dict_[attribute_key]['unit'] = unit
-            
-            elif type_ == 'value_map':
-                values = [tuple_[1] for tuple_ in sum(attribute, [])]
-                unit = get_unit(values)
-                dict_[attribute_key]['value'] = [[[tuple_[0].name, tuple_[1].value] for tuple_ in tuples] for tuples in attribute]
-                dict_[attribute_key]['unit'] = unit
-            
+                dict_[attribute_key] = {'name': name, 'value': attribute.value, 'unit': attribute.unit}
+
+            elif type_ == 'value_list' or type_ == 'value_map':
+                # the unit of a `ValueList` or `SegmentMap` is set when it is built
+                dict_[attribute_key] = {'name': name, 'value': attribute.to_list(), 'unit': attribute.unit}
+
+        recorder.record('company.to_dict', perf_counter() - start)
+
         return dict_
     
 
+def get_attribute_from_dict(attribute_key, attribute_dict, years):
+    '''
+    Converts an attribute in the format of `companies.json` 
+    back into its type (see `Company.to_dict`).
+
+    Parameters
+    ----------
+    attribute_key : str
+        key of the attribute in `company_attributes`
+    attribute_dict : dict
+        `dict` with the `"value"` and `"unit"` of the 
+        attribute, or `None` if it was not saved
+    years : list
+        list of consecutive fiscal years of the company
+
+    Returns
+    -------
+    attribute : Any
+    '''
+
+    type_ = company_attributes[attribute_key]['type']
+
+    if attribute_dict is None:
+        value, unit = None, None
+
+    else:
+        value, unit = attribute_dict['value'], attribute_dict['unit']
+
+    if type_ == 'other':
+        return value
+
+    elif type_ == 'value':
+        return Value(value, unit)
+
+    elif type_ == 'value_list':
+        if value is None:
+            return ValueList([Value(None) for _ in years])
+
+        return ValueList.from_list(value, unit)
+
+    elif type_ == 'value_map':
+        if value is None:
+            return SegmentMap.empty(len(years))
+
+        return SegmentMap.from_list(value, unit)
+
+
+def retry_with_rics(companies, batch_size=None):
+    '''
+    Sends the RIC requests that were deferred by the companies 
+    (see `Company.pending_ric`) as batched requests, one batch 
+    per range of requested years, and merges the responses 
+    into the companies.
+
+    Parameters
+    ----------
+    companies : dict
+        `dict` mapping identifiers to `Company` objects
+    batch_size : int
+        maximum number of RICs per request, if `None` all 
+        RICs with the same requested years are sent at once
+
+    Returns
+    -------
+    rics : dict
+        `dict` mapping the identifiers for which the RIC gave 
+        more data to the RIC, to be requested directly next time
+    '''
+
+    from refinitiv.request import Request
+
+    refinitiv_request_attributes = get_source_attributes(company_attributes, 'refinitiv')
+    batches = {}
+    rics = {}
+
+    for identifier, company in companies.items():
+        if company.pending_ric is not None:
+            batches.setdefault(tuple(company.request_years), []).append(identifier)
+
+    for request_years, identifiers in batches.items():
+        for i in range(0, len(identifiers), batch_size or len(identifiers)):
+            batch = identifiers[i:i+(batch_size or len(identifiers))]
+            refinitiv_requests = Request.batch([companies[identifier].pending_ric for identifier in batch], \
+                refinitiv_request_attributes, list(request_years))
+
+            for identifier in batch:
+                company = companies[identifier]
+                ric = company.pending_ric
+
+                if company.merge_ric_request(refinitiv_requests[ric]):
+                    rics[identifier] = ric
+
+    return rics
+
+
+def get_years(years_back):
+    '''
+    Outputs the fiscal years to be analyzed, 
+    starting with the current year.
+
+    Parameters
+    ----------
+    years_back : int
+        number of consecutive fiscal years to 
+        be analyzed
+
+    Returns
+    -------
+    years : list
+        list of consecutive fiscal years
+    '''
+
+    years = list(range(current_year, current_year-years_back-1, -1))
+
+    return years
+
+
+def get_request_years(years, saved_company=None, open_years=config['cache']['open_fiscal_years']):
+    '''
+    Outputs the consecutive fiscal years that have to be 
+    requested to update a saved company: every year that 
+    is missing from the saved company and the `open_years` 
+    most recent years, which may still change. Years that 
+    were open when the company was saved (the `open_years` 
+    most recent years of the saved company) are requested 
+    again as well, however long ago it was saved.
+
+    Parameters
+    ----------
+    years : list
+        list of consecutive fiscal years to be analyzed
+    saved_company : dict
+        the company as saved in `companies.json` or 
+        `None`, in which case all `years` are requested
+    open_years : int
+        number of the most recent fiscal years that 
+        are always requested (`"open_fiscal_years"` 
+        under `"cache"` in `refinitiv/config.json`)
+
+    Returns
+    -------
+    request_years : list
+        list of consecutive fiscal years
+    '''
+
+    if saved_company is None or saved_company['error']['value']:
+        return years
+
+    saved_years = saved_company['years']['value']
+    # the years that were still open when the company was saved may have changed since
+    newest_year = min(current_year, max(saved_years, default=current_year))
+    request_years = [year for year in years if year not in saved_years or year > newest_year-open_years]
+
+    return list(range(max(request_years), min(request_years)-1, -1))
+
+
 def get_source_attributes(company_attributes, source):
     '''
     Outputs all attributes with the given source.
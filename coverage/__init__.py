@@ -1,4 +1,4 @@
 import json
 
-with open('coverage/config.json') as file:
+with open('coverage/config.json', encoding='utf-8') as file:
     config = json.load(file)
\ No newline at end of file
@@ -1,24 +1,124 @@
 from . import config
 from values import Value, ValueList
+import numpy as np
 
 def analize_value_lists(companies, analysis_attributes=config['analysis_attributes']):
-    results = ValueList([Value(0)]*len(analysis_attributes))
+    availability, _, _ = get_availability(companies, analysis_attributes)
+    counts = availability.any(axis=2).sum(axis=0)
 
-    for company in companies:
-        results += check_value_lists(company, analysis_attributes=analysis_attributes)
+    if len(availability) == 0:
+        results = [Value(None) for _ in analysis_attributes]
+
+    else:
+        results = [Value(int(count)/len(availability)*100, '%') for count in counts]
 
-    results /= ValueList([Value(len(companies))]*len(analysis_attributes))
-    results *= Value(100, '%')
     analysis = {analysis_attribute: result for analysis_attribute, result in zip(analysis_attributes, results)}
 
     return analysis
 
 
+def get_availability(companies, analysis_attributes=config['analysis_attributes'], years=None, group_by=[]):
+    '''
+    Builds a boolean company x attribute x year array that is 
+    `True` where a value is available. `companies` can be any 
+    iterable of `Company` objects or `dict`s in the format of 
+    `companies.json`, and it is only iterated once, so companies 
+    can be streamed. If `years` is not given, it is the union of 
+    the years of all companies (most recent first). Also outputs 
+    the values of the `group_by` attributes of each company.
+    '''
+
+    company_availabilities = []
+    groups = {group: [] for group in group_by}
+
+    for company in companies:
+        company_years = get_attribute(company, 'years') or []
+        company_availability = np.zeros((len(analysis_attributes), len(company_years)), dtype=bool)
+
+        for j, analysis_attribute in enumerate(analysis_attributes):
+            value_list = get_attribute(company, analysis_attribute)
+
+            if value_list is None:
+                continue
+
+            elif isinstance(value_list, ValueList):
+                available = ~value_list.missing
+
+            else:
+                available = np.array([value is not None for value in value_list], dtype=bool)
+
+            n = min(len(available), len(company_years))
+            company_availability[j, :n] = available[:n]
+
+        company_availabilities.append((company_years, company_availability))
+
+        for group in group_by:
+            groups[group].append(get_attribute(company, group))
+
+    if years is None:
+        years = sorted(set().union(*[company_years for company_years, _ in company_availabilities]), reverse=True)
+
+    year_indices = {year: index for index, year in enumerate(years)}
+    availability = np.zeros((len(company_availabilities), len(analysis_attributes), len(years)), dtype=bool)
+
+    for i, (company_years, company_availability) in enumerate(company_availabilities):
+        indices = np.array([year_indices.get(year, -1) for year in company_years], dtype=int)
+        known = indices >= 0
+        availability[i][:, indices[known]] = company_availability[:, known]
+
+    return availability, years, groups
+
+
+def get_coverage_reports(companies, analysis_attributes=config['analysis_attributes'], group_by=[]):
+    '''
+    Computes coverage reports (in %) with `pandas.DataFrame`s:
+
+    "attribute" : companies with at least one value, and 
+        available company-years, per attribute
+    "year" : available company-attributes per year
+    "attribute_year" : available companies per attribute and year
+    "<group>" : companies with at least one value per attribute 
+        for each value of the `other` attribute `<group>` in 
+        `group_by` (e.g. country or sector) that companies have
+    '''
+
+    # imported here, so that `analize_value_lists` does not load pandas
+    import pandas as pd
+
+    availability, years, groups = get_availability(companies, analysis_attributes, group_by=group_by)
+    any_year = availability.any(axis=2)
+
+    with np.errstate(all='ignore'):
+        reports = {
+            'attribute': pd.DataFrame({
+                'companies': any_year.mean(axis=0)*100,
+                'company_years': availability.mean(axis=(0, 2))*100
+            }, index=pd.Index(analysis_attributes, name='attribute')),
+            'year': pd.DataFrame({
+                'company_attributes': availability.mean(axis=(0, 1))*100
+            }, index=pd.Index(years, name='year')),
+            'attribute_year': pd.DataFrame(availability.mean(axis=0)*100,
+                index=pd.Index(analysis_attributes, name='attribute'), columns=pd.Index(years, name='year'))
+        }
+
+    for group in group_by:
+        reports[group] = pd.DataFrame(any_year, columns=analysis_attributes).groupby(pd.Series(groups[group], name=group)).mean()*100
+
+    return reports
+
+
+def get_attribute(company, attribute_key):
+    if isinstance(company, dict):
+        return company[attribute_key]['value'] if attribute_key in company else None
+
+    return getattr(company, attribute_key, None)
+
+
 def check_value_lists(company, analysis_attributes=config['analysis_attributes']):
     result = ValueList()
 
     for analysis_attribute in analysis_attributes:
-        result.append(is_not_only_none(company.__dict__[analysis_attribute]))
+        result.append(is_not_only_none(getattr(company, analysis_attribute)))
 
     return result
 
@@ -26,4 +126,4 @@ def check_value_lists(company, analysis_attributes=config['analysis_attributes']
 def is_not_only_none(value_list):
     nones = [value for value in value_list if value.value is None]
 
-    return Value(int(len(value_list) != len(nones)))
\ No newline at end of file
+    return Value(int(len(value_list) != len(nones)))
@@ -0,0 +1,349 @@
+'''
+The content of this module enables us to convert values
+reported in different currencies into a single currency,
+with one exchange rate per currency and fiscal year (the
+rate at the end of the year). The rates are kept in an
+`FxTable`, which is saved to `data/fx.json` (configured
+under `"fx"` in `refinitiv/config.json`), so rates are only
+requested once, in a single batched api call:
+
+>>> table = get_fx_table(get_currencies(companies), years)
+>>> table.convert(company.total_revenues, company.years)
+>>> table.convert(engine.evaluate('total_revenues'))
+
+Values without an exchange rate become missing, like
+any other operation on a missing value in `values.py`.
+'''
+
+from company import company_attributes
+from metrics import ValueMatrix
+from refinitiv import config
+from values import ValueList, SegmentMap
+from datetime import datetime
+import json
+import numpy as np
+from numpy import nan
+import os
+
+fx_config = config['fx']
+
+
+class FxTable:
+    '''
+    A class that holds exchange rates into the currency
+    `target` by currency and fiscal year.
+
+    ...
+
+    Attributes
+    ----------
+    target : str
+        the currency values are converted into
+    rates : dict
+        `dict` mapping currencies to `dict`s mapping fiscal
+        years to rates (units of `target` per unit of the
+        currency), which are `None` if the api has no rate
+
+    Methods
+    -------
+    load(path, target):
+        (class method) loads a saved table
+    save(path):
+        saves the table as JSON
+    get_missing(currencies, years):
+        outputs the currencies that lack rates of some years
+    update(rates):
+        adds rates to the table
+    get_rates(units, years):
+        outputs a unit x year array of rates
+    convert(attribute, years):
+        converts a `ValueList`, `SegmentMap` or `ValueMatrix`
+    convert_company(company):
+        converts the currency attributes of a company
+    '''
+
+    def __init__(self, target: str, rates: dict=None):
+        self.target = target
+        self.rates = rates or {}
+
+    @classmethod
+    def load(cls, path, target):
+        '''
+        Loads a table saved with `save`, or outputs an empty
+        table if there is none with the same target currency.
+
+        Parameters
+        ----------
+        path : str
+            path of the JSON file
+        target : str
+            the currency values are converted into
+
+        Returns
+        -------
+        table : FxTable
+        '''
+
+        if not os.path.exists(path):
+            return cls(target)
+
+        with open(path, encoding='utf-8') as file:
+            saved_table = json.load(file)
+
+        if saved_table['target'] != target:
+            return cls(target)
+
+        # JSON keys are strings
+        rates = {currency: {int(year): rate for year, rate in year_rates.items()} for currency, year_rates in saved_table['rates'].items()}
+
+        return cls(target, rates)
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({'target': self.target, 'rates': self.rates}, file)
+
+    def get_missing(self, currencies, years):
+        '''
+        Outputs the currencies of `currencies` whose rates
+        of some of the `years` have never been requested, or
+        have no rate yet in an open fiscal year (see
+        `"open_fiscal_years"` under `"cache"` in
+        `refinitiv/config.json`), whose rate can still come.
+
+        Parameters
+        ----------
+        currencies : iterable
+            currencies (`None` is ignored)
+        years : list
+            fiscal years
+
+        Returns
+        -------
+        missing : list
+        '''
+
+        first_open_year = datetime.now().year - config['cache']['open_fiscal_years'] + 1
+
+        def is_missing(year_rates, year):
+            return year not in year_rates or (year_rates[year] is None and year >= first_open_year)
+
+        return [currency for currency in dict.fromkeys(currencies) if currency not in [None, self.target] and \
+            any(is_missing(self.rates.get(currency, {}), year) for year in years)]
+
+    def update(self, rates):
+        for currency, year_rates in rates.items():
+            self.rates.setdefault(currency, {}).update(year_rates)
+
+    def get_rates(self, units, years):
+        '''
+        Outputs the rates of each unit and year, which are 1
+        for the target currency and for `None` (values without
+        a unit are all missing) and `nan` if there is no rate.
+
+        Parameters
+        ----------
+        units : list
+            currency of each row
+        years : list
+            fiscal years
+
+        Returns
+        -------
+        rates : numpy.ndarray
+            `len(units)` x `len(years)` array
+        '''
+
+        unit_rates = {}
+
+        for unit in set(units):
+            if unit is None or unit == self.target:
+                unit_rates[unit] = np.ones(len(years))
+
+            else:
+                year_rates = self.rates.get(unit, {})
+                unit_rates[unit] = np.array([nan if year_rates.get(year) is None else year_rates[year] for year in years], dtype=float)
+
+        return np.array([unit_rates[unit] for unit in units], dtype=float).reshape(len(units), len(years))
+
+    def convert(self, attribute, years=None):
+        '''
+        Converts all values into the target currency in one
+        vectorized step.
+
+        Parameters
+        ----------
+        attribute : ValueList, SegmentMap or ValueMatrix
+            values with currencies as units
+        years : list
+            fiscal years of a `ValueList` or `SegmentMap`
+            (a `ValueMatrix` has its own)
+
+        Returns
+        -------
+        ValueList, SegmentMap or ValueMatrix
+        '''
+
+        if isinstance(attribute, ValueMatrix):
+            rates = self.get_rates(list(attribute.units), attribute.years)
+            units = [None if unit is None else self.target for unit in attribute.units]
+            integer = all(unit in [None, self.target] for unit in attribute.units) and attribute.integer
+
+        elif isinstance(attribute, (ValueList, SegmentMap)):
+            if len(years) != len(attribute):
+                raise ValueError(f'{len(years)} years given for {len(attribute)} years of values')
+
+            rates = self.get_rates([attribute.unit], years)[0]
+            rates = rates[attribute.years] if isinstance(attribute, SegmentMap) else rates
+            unit = None if attribute.unit is None else self.target
+            integer = attribute.unit in [None, self.target] and attribute.integer
+
+        else:
+            raise TypeError(f'can only convert ValueList, SegmentMap or ValueMatrix objects, not {type(attribute)} objects')
+
+        missing = attribute.missing | np.isnan(rates)
+
+        with np.errstate(all='ignore'):
+            array = attribute.array * rates
+
+        array[missing] = nan
+
+        if isinstance(attribute, ValueMatrix):
+            return ValueMatrix(attribute.identifiers, attribute.years, array, missing, units, integer)
+
+        elif isinstance(attribute, SegmentMap):
+            return SegmentMap.from_arrays(len(attribute), attribute.years, attribute.segments, array, missing, unit, integer)
+
+        else:
+            return ValueList.from_arrays(array, missing, unit, integer)
+
+    def convert_company(self, company):
+        '''
+        Converts the `value_list`s and `value_map`s with the
+        `unit_type` `"currency"` of a company (in place).
+
+        Parameters
+        ----------
+        company : company.company.Company
+
+        Returns
+        -------
+        None
+        '''
+
+        for attribute_key in get_currency_attributes():
+            company.__dict__[attribute_key] = self.convert(getattr(company, attribute_key), company.years)
+
+
+def get_currency_attributes():
+    return [attribute_key for attribute_key, attribute in company_attributes.items() if \
+        attribute['unit_type'] == 'currency' and attribute['type'] in ['value_list', 'value_map']]
+
+
+def get_currencies(companies):
+    '''
+    Outputs the currencies of the currency attributes of
+    `companies`, which can be `Company` objects or `dict`s
+    in the format of `companies.json`.
+
+    Parameters
+    ----------
+    companies : iterable
+
+    Returns
+    -------
+    currencies : list
+    '''
+
+    currencies = set()
+
+    for company in companies:
+        for attribute_key in get_currency_attributes():
+            if isinstance(company, dict):
+                currencies.add(company[attribute_key]['unit'] if attribute_key in company else None)
+
+            else:
+                currencies.add(getattr(company, attribute_key).unit)
+
+    currencies.discard(None)
+
+    return sorted(currencies)
+
+
+def fetch_rates(currencies, years, target):
+    '''
+    Fetches the rates of `currencies` into `target` of the
+    `years` in a single api call (which is also cached by
+    `refinitiv.api`).
+
+    Parameters
+    ----------
+    currencies : list
+        currencies to be fetched
+    years : list
+        fiscal years
+    target : str
+        the currency values are converted into
+
+    Returns
+    -------
+    rates : dict
+        `dict` in the format of `FxTable.rates`, with `None`
+        for the years without a rate
+    '''
+
+    from refinitiv import api
+
+    instruments = {fx_config['formattable_instrument_str'].format(currency, target): currency for currency in currencies}
+    rate_str = fx_config['formattable_rate_str'].format(min(years), max(years))
+    df = api.get_data(list(instruments), [rate_str, rate_str+fx_config['date_str']])
+    rates = {currency: {year: None for year in years} for currency in currencies}
+
+    if df is None:
+        return rates
+
+    for instrument, rate, date in df.itertuples(index=False, name=None):
+        currency = instruments.get(instrument)
+
+        if currency is None or rate is None or date is None:
+            continue
+
+        year = int(str(date)[:4])
+
+        if year in rates[currency]:
+            rates[currency][year] = float(rate)
+
+    return rates
+
+
+def get_fx_table(currencies, years, target=fx_config['target'], path=fx_config['path'], fetch=True):
+    '''
+    Loads the saved `FxTable` and, if some rates have never
+    been requested, fetches them in a single api call and
+    saves the table again.
+
+    Parameters
+    ----------
+    currencies : iterable
+        currencies to be converted (see `get_currencies`)
+    years : list
+        fiscal years to be converted
+    target : str
+        the currency values are converted into
+    path : str
+        path of the saved table
+    fetch : bool
+        whether to fetch missing rates
+
+    Returns
+    -------
+    table : FxTable
+    '''
+
+    table = FxTable.load(path, target)
+    missing = table.get_missing(currencies, years)
+
+    if fetch and len(missing) > 0:
+        table.update(fetch_rates(missing, years, target))
+        table.save(path)
+
+    return table
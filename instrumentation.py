@@ -0,0 +1,140 @@
+'''
+The content of this module enables us to record timings
+and counters of the fetch pipeline and to summarize them.
+All modules record into the shared `recorder`:
+
+>>> with recorder.timer('api.request') as info:
+...     info['rows'] = len(df)
+>>> recorder.count('company.errors')
+>>> recorder.save_summary('data/run_metrics.json')
+'''
+
+from contextlib import contextmanager
+import json
+import numpy as np
+import threading
+import time
+
+
+class Recorder:
+    '''
+    A thread-safe recorder of timings and counters.
+
+    ...
+
+    Attributes
+    ----------
+    timings : dict
+        `dict` mapping names to lists of durations in seconds
+    totals : dict
+        `dict` mapping names to sums of the numeric
+        information recorded with the timings
+    counters : dict
+        `dict` mapping names to counts
+    listeners : list
+        callbacks `listener(name, seconds, info)` that are
+        called on every event (`seconds` is `None` for counts)
+
+    Methods
+    -------
+    record(name, seconds, **info):
+        records a duration
+    timer(name):
+        (context manager) records the duration of a block
+    count(name, n, **info):
+        increases a counter
+    add_listener(listener):
+        adds a callback for every event
+    summary():
+        outputs latency percentiles, throughput and counters
+    save_summary(path):
+        saves the summary as JSON
+    reset():
+        removes all recorded events
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timings = {}
+            self.totals = {}
+            self.counters = {}
+            self.started = time.perf_counter()
+
+    def record(self, name, seconds, **info):
+        with self.lock:
+            self.timings.setdefault(name, []).append(seconds)
+            totals = self.totals.setdefault(name, {})
+
+            for key, value in info.items():
+                if isinstance(value, (int, float)):
+                    totals[key] = totals.get(key, 0) + value
+
+        for listener in self.listeners:
+            listener(name, seconds, info)
+
+    @contextmanager
+    def timer(self, name):
+        info = {}
+        start = time.perf_counter()
+
+        try:
+            yield info
+
+        finally:
+            self.record(name, time.perf_counter() - start, **info)
+
+    def count(self, name, n=1, **info):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+        for listener in self.listeners:
+            listener(name, None, info)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def summary(self):
+        '''
+        Outputs a summary of the recorded events: for every
+        timing its count, total, mean, p50, p95, p99 and max
+        (in seconds), throughput (events per second of the
+        run) and the sums of its numeric information, and
+        all counters.
+
+        Returns
+        -------
+        summary : dict
+        '''
+
+        with self.lock:
+            elapsed = time.perf_counter() - self.started
+            timings = {name: np.array(seconds) for name, seconds in self.timings.items()}
+            summary = {'elapsed': elapsed, 'timings': {}, 'counters': dict(self.counters)}
+
+            for name, seconds in timings.items():
+                p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+                summary['timings'][name] = {
+                    'count': len(seconds),
+                    'total': float(seconds.sum()),
+                    'mean': float(seconds.mean()),
+                    'p50': float(p50),
+                    'p95': float(p95),
+                    'p99': float(p99),
+                    'max': float(seconds.max()),
+                    'throughput': len(seconds)/elapsed if elapsed > 0 else None,
+                    **self.totals.get(name, {})
+                }
+
+        return summary
+
+    def save_summary(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.summary(), file, indent=4)
+
+
+recorder = Recorder()
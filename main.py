@@ -1,40 +1,267 @@
-from company.company import Company
+from company.company import Company, retry_with_rics
 from coverage.analysis import analize_value_lists
+from instrumentation import recorder
+from serialization import dumps, iter_companies, iter_jsonl, write_companies
+import argparse
 import json
-from tqdm import tqdm
-from numpy.random import shuffle
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+checkpoint_path = 'data/companies.checkpoint.jsonl'
+metrics_path = 'data/run_metrics.json'
+rics_path = 'data/rics.json'
 
 
 def get_identifiers():
-    with open('data/identifiers.json') as file:
+    with open('data/identifiers.json', encoding='utf-8') as file:
         identifiers = json.load(file)
 
     return identifiers
 
 
-def get_companies(identifiers, first_index=None, last_index=None, randomize=False):
-    companies = {}
+def get_saved_companies():
+    if not os.path.exists('data/companies.json'):
+        return {}
+
+    with open('data/companies.json', encoding='utf-8') as file:
+        saved_companies = json.load(file)
+
+    return saved_companies
+
+
+def get_rics():
+    if not os.path.exists(rics_path):
+        return {}
+
+    with open(rics_path, encoding='utf-8') as file:
+        rics = json.load(file)
+
+    return rics
+
+
+def save_rics(rics):
+    with open(rics_path, 'w', encoding='utf-8') as file:
+        json.dump(rics, file)
+
+
+def get_companies(identifiers, first_index=None, last_index=None, randomize=False, batch_size=None, workers=None, saved_companies=None, checkpoint=None, rics=None):
+    # imported here, so that the offline helpers of this module start quickly
+    from tqdm import tqdm
+    from numpy.random import shuffle
+
+    unique_companies = {}
 
     if randomize:
         shuffle(identifiers)
 
-    for identifier in tqdm(identifiers[first_index:last_index]):
-        if identifier is not None:
-            company = Company(identifier)
-            companies[identifier] = company
+    identifiers = [identifier for identifier in identifiers[first_index:last_index] if identifier is not None]
+    # duplicates and identifiers that resolve to the same RIC are only fetched once
+    aliases = get_aliases(identifiers, rics)
+    unique_identifiers = list(aliases)
+    batches = [unique_identifiers[i:i+(batch_size or 1)] for i in range(0, len(unique_identifiers), batch_size or 1)]
+
+    with tqdm(total=len(unique_identifiers)) as progress_bar:
+        if workers is None:
+            results = []
+
+            for batch in batches:
+                results.append(get_batch(batch, batch_size, saved_companies, rics))
+                write_checkpoint(get_alias_companies(results[-1], aliases), checkpoint)
+                recorder.count('main.companies', len(batch))
+                progress_bar.update(len(batch))
+
+        else:
+            # the shared rate limiter in `refinitiv.api` bounds the request rate across workers
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(get_batch, batch, batch_size, saved_companies, rics) for batch in batches]
+                batch_lengths = {future: len(batch) for future, batch in zip(futures, batches)}
+
+                for future in as_completed(futures):
+                    write_checkpoint(get_alias_companies(future.result(), aliases), checkpoint)
+                    recorder.count('main.companies', batch_lengths[future])
+                    progress_bar.update(batch_lengths[future])
+
+            results = [future.result() for future in futures]
+
+    for result in results:
+        unique_companies.update(result)
+
+    # retries the companies with little data with their RICs in one deferred pass
+    pending = [identifier for identifier, company in unique_companies.items() if company.pending_ric is not None]
+    found_rics = retry_with_rics(unique_companies, batch_size)
+    write_checkpoint(get_alias_companies({identifier: unique_companies[identifier] for identifier in pending}, aliases), checkpoint)
+
+    if rics is not None:
+        rics.update(found_rics)
+
+    companies = get_alias_companies(unique_companies, aliases)
 
     return companies
 
 
-def save_companies(companies):
-    company_dicts = {identifier: company.to_dict() for identifier, company in companies.items()}
+def get_companies_pipelined(identifiers, batch_size=None, workers=None, processes=None, saved_companies=None, checkpoint=None, rics=None):
+    # fetches with `workers` threads and parses in `processes` worker processes, see `pipeline`
+    from pipeline import run_pipeline
+    from tqdm import tqdm
+
+    identifiers = [identifier for identifier in identifiers if identifier is not None]
+    aliases = get_aliases(identifiers, rics)
+
+    with tqdm(total=len(aliases)) as progress_bar:
+        for identifier, company_dict in run_pipeline(list(aliases), batch_size, workers or 1, processes, saved_companies=saved_companies, rics=rics):
+            if checkpoint is not None:
+                for alias in aliases[identifier]:
+                    checkpoint.write(dumps({'identifier': alias, 'company': company_dict}) + '\n')
+
+                checkpoint.flush()
+
+            recorder.count('main.companies')
+            progress_bar.update(1)
+
+
+def get_aliases(identifiers, rics=None):
+    # maps one normalized identifier per distinct request to all the identifiers it covers
+    rics = rics or {}
+    representatives = {}
+    aliases = {}
+
+    for identifier in identifiers:
+        normalized_identifier = identifier.strip()
+
+        if normalized_identifier == '':
+            continue
+
+        representative = representatives.setdefault(rics.get(normalized_identifier, normalized_identifier), normalized_identifier)
+        aliases.setdefault(representative, [])
+
+        if identifier not in aliases[representative]:
+            aliases[representative].append(identifier)
+
+    return aliases
+
+
+def get_alias_companies(companies, aliases):
+    return {alias: company for identifier, company in companies.items() for alias in aliases[identifier]}
+
+
+def get_batch(batch, batch_size=None, saved_companies=None, rics=None):
+    saved_companies = saved_companies or {}
+    rics = rics or {}
+
+    if batch_size is None:
+        return {identifier: Company(rics.get(identifier, identifier), saved_company=saved_companies.get(identifier), defer_ric_retry=True) for \
+            identifier in batch}
 
-    with open('data/companies.json', 'w') as file:
-        json.dump(company_dicts, file)
+    else:
+        return Company.from_batch(batch, saved_companies=saved_companies, rics=rics, defer_ric_retry=True)
+
+
+def write_checkpoint(companies, checkpoint=None):
+    if checkpoint is None:
+        return
+
+    for identifier, company in companies.items():
+        # companies waiting for a RIC retry are written once it is done
+        if company.pending_ric is not None:
+            continue
+
+        checkpoint.write(dumps({'identifier': identifier, 'company': company.to_dict()}) + '\n')
+
+    checkpoint.flush()
+
+
+def read_checkpoint(path=checkpoint_path):
+    company_dicts = {}
+
+    if not os.path.exists(path):
+        return company_dicts
+
+    for identifier, company_dict in iter_companies(path):
+        company_dicts[identifier] = company_dict
+
+    return company_dicts
+
+
+def load_companies(path='data/companies.json', lazy=False):
+    with open(path, encoding='utf-8') as file:
+        company_dicts = json.load(file)
+
+    companies = {identifier: Company.from_dict(company_dict, lazy) for identifier, company_dict in company_dicts.items()}
+
+    return companies
+
+
+def save_companies(companies, path='data/companies.json'):
+    # companies are serialized one at a time while they are written
+    if path.endswith('.json') or path.endswith('.jsonl'):
+        with open(path, 'w', encoding='utf-8') as file:
+            write_companies(companies, file, jsonl=path.endswith('.jsonl'))
+
+    else:
+        from storage import save_table
+
+        save_table(((identifier, company.to_dict()) for identifier, company in companies.items()), path)
+
+
+def iter_checkpoint(path=checkpoint_path):
+    # the first pass only keeps the offset of the last line of each identifier, the second one reads those lines
+    offsets = {}
+
+    if not os.path.exists(path):
+        return
+
+    with open(path, 'rb') as file:
+        for offset, entry in iter_jsonl(file):
+            offsets[entry['identifier']] = offset
+
+        for identifier, offset in offsets.items():
+            file.seek(offset)
+
+            yield identifier, json.loads(file.readline())['company']
+
+
+def save_checkpoint(path=checkpoint_path):
+    with open('data/companies.json', 'w', encoding='utf-8') as file:
+        write_companies(iter_checkpoint(path), file)
+
+    os.remove(path)
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=None, help='number of identifiers per api call')
+    parser.add_argument('--workers', type=int, default=None, help='number of concurrent requests')
+    parser.add_argument('--incremental', action='store_true', help='only fetch missing or open fiscal years of saved companies')
+    parser.add_argument('--table', default=None, help='also save the companies as a long table (.parquet or .npz)')
+    parser.add_argument('--resume', action='store_true', help='skip identifiers that are already in the checkpoint of an interrupted run')
+    parser.add_argument('--processes', type=int, default=None, help='parse and serialize in this many worker processes while fetching (pipeline)')
+    args = parser.parse_args()
+
     identifiers = get_identifiers()
-    companies = get_companies(identifiers)
-    save_companies(companies)
-    analysis = analize_value_lists(companies.values())
+    saved_companies = get_saved_companies() if args.incremental else None
+    rics = get_rics()
+    checkpointed = read_checkpoint() if args.resume else {}
+    identifiers = [identifier for identifier in identifiers if identifier not in checkpointed]
+
+    with open(checkpoint_path, 'a' if args.resume else 'w', encoding='utf-8') as checkpoint:
+        # starts on a new line in case the last line of the interrupted run is incomplete
+        if checkpoint.tell() > 0:
+            checkpoint.write('\n')
+
+        if args.processes is None:
+            get_companies(identifiers, batch_size=args.batch_size, workers=args.workers, saved_companies=saved_companies, checkpoint=checkpoint, rics=rics)
+
+        else:
+            get_companies_pipelined(identifiers, batch_size=args.batch_size, workers=args.workers, processes=args.processes, \
+                saved_companies=saved_companies, checkpoint=checkpoint, rics=rics)
+
+    save_rics(rics)
+    save_checkpoint()
+
+    if args.table is not None:
+        from storage import save_table
+
+        save_table(iter_companies(), args.table)
+
+    analysis = analize_value_lists(company_dict for _, company_dict in iter_companies())
+    recorder.save_summary(metrics_path)
@@ -0,0 +1,431 @@
+'''
+The content of this module enables us to compute derived
+metrics (e.g. loan losses over total revenue) of many
+companies at once. An attribute of all companies is stacked
+into a company x year `ValueMatrix`, and metrics are given
+as expressions: nested tuples (or JSON lists) of an operation
+and its operands.
+
+>>> engine = MetricsEngine(companies)
+>>> engine.evaluate(('ratio', 'loan_losses', 'total_revenues'))
+>>> engine.evaluate(('growth', 'impairment_fixed_assets'))
+>>> engine.evaluate(('rolling_mean', ('ratio', 'loan_losses', 'total_revenues'), 3))
+
+Operands are attribute keys, expressions, numbers or values
+written as `('value', value, unit)`. Missing values and units
+follow the rules of `values.py`: a result is missing where an
+operand is missing (or a divisor is 0), a sum or difference
+of different units raises a `TypeError`, and a sum or
+difference with a company without a unit is missing.
+'''
+
+from values import Value, ValueList, add_units, divide_units, intern_unit, multiply_units
+from instrumentation import recorder
+import numpy as np
+from numpy import nan
+import operator
+
+
+class ValueMatrix:
+    '''
+        Class to represent an attribute of many companies over the same
+        fiscal years: a company x year float64 array next to a mask of
+        missing values, with a unit per company (row). Arithmetic is
+        vectorized and follows `ValueList` row by row.
+    '''
+
+    def __init__(self, identifiers, years, array, missing, units, integer=False):
+        self.identifiers = list(identifiers)
+        self.years = list(years)
+        self.array = np.asarray(array, dtype=float).reshape(len(self.identifiers), len(self.years))
+        self.missing = np.asarray(missing, dtype=bool).reshape(self.array.shape)
+        self.units = np.empty(len(self.identifiers), dtype=object)
+        self.units[:] = [intern_unit(unit) for unit in units]
+        self.integer = integer
+
+    @classmethod
+    def from_companies(cls, companies, attribute_key, years):
+        '''
+            Stacks the `value_list` `attribute_key` of `companies` (a `list`
+            of `(identifier, company)` pairs with `Company` objects or `dict`s
+            in the format of `companies.json`) aligned to `years`.
+        '''
+
+        year_indices = {year: index for index, year in enumerate(years)}
+        array = np.full((len(companies), len(years)), nan)
+        missing = np.ones((len(companies), len(years)), dtype=bool)
+        units = []
+        integer = True
+
+        for i, (_, company) in enumerate(companies):
+            value_list = get_attribute_value_list(company, attribute_key)
+            company_years = get_company_years(company)
+            units.append(None if value_list is None else value_list.unit)
+
+            if value_list is None:
+                continue
+
+            n = min(len(value_list), len(company_years))
+            integer = integer and value_list.integer
+
+            if company_years[:n] == years[:n]:
+                array[i, :n] = value_list.array[:n]
+                missing[i, :n] = value_list.missing[:n]
+
+            else:
+                indices = np.array([year_indices.get(year, -1) for year in company_years[:n]], dtype=int)
+                known = indices >= 0
+                array[i, indices[known]] = value_list.array[:n][known]
+                missing[i, indices[known]] = value_list.missing[:n][known]
+
+        return cls([identifier for identifier, _ in companies], years, array, missing, units, integer)
+
+    def __repr__(self):
+        return f'ValueMatrix({len(self.identifiers)} companies x {len(self.years)} years)'
+
+    def __len__(self):
+        return len(self.identifiers)
+
+    def __eq__(self, value_matrix):
+        return (isinstance(value_matrix, ValueMatrix) and
+            self.identifiers == value_matrix.identifiers and
+            self.years == value_matrix.years and
+            list(self.units) == list(value_matrix.units) and
+            np.array_equal(self.missing, value_matrix.missing) and
+            np.array_equal(self.array[~self.missing], value_matrix.array[~value_matrix.missing]))
+
+    def get_value_list(self, identifier):
+        i = self.identifiers.index(identifier)
+
+        return ValueList.from_arrays(self.array[i].copy(), self.missing[i].copy(), self.units[i], self.integer)
+
+    def to_value_lists(self):
+        return {identifier: self.get_value_list(identifier) for identifier in self.identifiers}
+
+    def to_frame(self):
+        '''
+            Outputs the values as a `pandas.DataFrame` (companies x years)
+            with missing values as `NaN`.
+        '''
+
+        import pandas as pd
+
+        return pd.DataFrame(np.where(self.missing, nan, self.array), index=pd.Index(self.identifiers, name='company'), \
+            columns=pd.Index(self.years, name='year'))
+
+    def align(self, other):
+        '''
+            Converts `other` (a `ValueMatrix`, `Value` or number)
+            into a `ValueMatrix` of the same shape.
+        '''
+
+        if isinstance(other, (int, float)):
+            other = Value(other)
+
+        if isinstance(other, Value):
+            shape = self.array.shape
+            array = np.full(shape, nan if other.value is None else other.value)
+            missing = np.full(shape, other.value is None)
+
+            return ValueMatrix(self.identifiers, self.years, array, missing, [other.unit]*len(self), isinstance(other.value, int))
+
+        elif not isinstance(other, ValueMatrix):
+            raise TypeError(f'can only combine ValueMatrix, Value or number objects, not {type(other)} objects')
+
+        elif other.identifiers != self.identifiers or other.years != self.years:
+            raise ValueError('the companies and years of both matrices must be the same')
+
+        return other
+
+    def __add__(self, other):
+        return self.add_or_subtract(other, np.add)
+
+    def __sub__(self, other):
+        return self.add_or_subtract(other, np.subtract)
+
+    def add_or_subtract(self, other, operation):
+        other = self.align(other)
+        units = combine_units(self.units, other.units, add_units)
+        # rows where one unit is `None` are missing, like `ValueList`s
+        no_unit = np.array([unit is False for unit in units], dtype=bool)
+        units[no_unit] = None
+        missing = self.missing | other.missing | no_unit[:, None]
+
+        with np.errstate(all='ignore'):
+            array = operation(self.array, other.array)
+
+        array[missing] = nan
+
+        return ValueMatrix(self.identifiers, self.years, array, missing, units, self.integer and other.integer)
+
+    def __radd__(self, other):
+        return self.align(other) + self
+
+    def __rsub__(self, other):
+        return self.align(other) - self
+
+    def __mul__(self, other):
+        other = self.align(other)
+        units = combine_units(self.units, other.units, multiply_units)
+        missing = self.missing | other.missing
+
+        with np.errstate(all='ignore'):
+            array = self.array * other.array
+
+        array[missing] = nan
+
+        return ValueMatrix(self.identifiers, self.years, array, missing, units, self.integer and other.integer)
+
+    def __truediv__(self, other):
+        other = self.align(other)
+        units = combine_units(self.units, other.units, divide_units)
+        missing = self.missing | other.missing | (other.array == 0)
+
+        with np.errstate(all='ignore'):
+            array = self.array / other.array
+
+        array[missing] = nan
+
+        return ValueMatrix(self.identifiers, self.years, array, missing, units)
+
+    def __rmul__(self, other):
+        return self.align(other) * self
+
+    def __rtruediv__(self, other):
+        return self.align(other) / self
+
+    def shift(self, years_back):
+        '''
+            Outputs the values of `years_back` fiscal years earlier in
+            the column of each year (missing if that year is not included).
+        '''
+
+        year_indices = {year: index for index, year in enumerate(self.years)}
+        columns = np.array([year_indices.get(year - years_back, -1) for year in self.years], dtype=int)
+        known = columns >= 0
+        array = np.full(self.array.shape, nan)
+        missing = np.ones(self.missing.shape, dtype=bool)
+        array[:, known] = self.array[:, columns[known]]
+        missing[:, known] = self.missing[:, columns[known]]
+
+        return ValueMatrix(self.identifiers, self.years, array, missing, self.units, self.integer)
+
+    def growth(self):
+        '''
+            Outputs the growth since the previous fiscal year,
+            `(value - previous)/previous`, without a unit.
+        '''
+
+        previous = self.shift(1)
+
+        return (self - previous)/previous
+
+    def rolling_mean(self, window):
+        '''
+            Outputs the mean of each fiscal year and the `window - 1`
+            years before it, which is missing if any of them is missing.
+        '''
+
+        total = self
+
+        for years_back in range(1, window):
+            total = total + self.shift(years_back)
+
+        return total*Value(1/window)
+
+
+def combine_units(units_1, units_2, combine):
+    '''
+        Applies a unit function (e.g. `multiply_units`) to the
+        units of each row, once per distinct pair of units.
+    '''
+
+    results = {}
+    units = np.empty(len(units_1), dtype=object)
+
+    for i, pair in enumerate(zip(units_1.tolist(), units_2.tolist())):
+        if pair not in results:
+            results[pair] = combine(*pair)
+
+        units[i] = results[pair]
+
+    return units
+
+
+def get_attribute_value_list(company, attribute_key):
+    if isinstance(company, dict):
+        if attribute_key not in company or company[attribute_key]['value'] is None:
+            return None
+
+        return ValueList.from_list(company[attribute_key]['value'], company[attribute_key]['unit'])
+
+    return getattr(company, attribute_key, None)
+
+
+def get_company_years(company):
+    if isinstance(company, dict):
+        return company['years']['value'] if 'years' in company else []
+
+    return getattr(company, 'years', None) or []
+
+
+def reflect(binary_operator, reflected_operator):
+    '''
+        Outputs a binary operation that is delegated to the reflected
+        operator (e.g. `"__radd__"`) of a `ValueMatrix` on the right,
+        since a `Value` on the left does not know matrices.
+    '''
+
+    def operation(value_1, value_2):
+        if isinstance(value_2, ValueMatrix) and not isinstance(value_1, ValueMatrix):
+            return getattr(value_2, reflected_operator)(value_1)
+
+        return binary_operator(value_1, value_2)
+
+    return operation
+
+
+operations = {
+    'value': lambda value, unit=None: Value(value, unit),
+    'sum': reflect(operator.add, '__radd__'),
+    'difference': reflect(operator.sub, '__rsub__'),
+    'product': reflect(operator.mul, '__rmul__'),
+    'ratio': reflect(operator.truediv, '__rtruediv__'),
+    'growth': lambda value: value.growth(),
+    'rolling_mean': lambda value, window: value.rolling_mean(window)
+}
+
+
+class MetricsEngine:
+    '''
+    A class that evaluates metric expressions (see the module
+    docstring) on a fixed set of companies. Every attribute is
+    stacked once, and the result of every (sub-)expression is
+    cached, so metrics sharing inputs are cheap.
+
+    ...
+
+    Attributes
+    ----------
+    companies : list
+        `list` of `(identifier, company)` pairs
+    identifiers : list
+        identifiers of the companies (rows)
+    years : list
+        fiscal years (columns), most recent first
+    cache : dict
+        `dict` mapping expressions to their results
+
+    Methods
+    -------
+    evaluate(expression):
+        outputs the result of an expression
+    evaluate_all(metrics):
+        outputs the results of named expressions
+    clear():
+        empties the cache
+    '''
+
+    def __init__(self, companies, years=None):
+        '''
+        Parameters
+        ----------
+        companies : dict or iterable
+            `dict` mapping identifiers to `Company` objects or to
+            companies in the format of `companies.json`, or an
+            iterable of `(identifier, company)` pairs
+        years : list
+            fiscal years to be included, if `None` the union of
+            the years of all companies (most recent first)
+        '''
+
+        if isinstance(companies, dict):
+            companies = companies.items()
+
+        self.companies = list(companies)
+        self.identifiers = [identifier for identifier, _ in self.companies]
+
+        if years is None:
+            years = sorted(set().union(*[get_company_years(company) for _, company in self.companies]), reverse=True)
+
+        self.years = list(years)
+        self.cache = {}
+
+    def evaluate(self, expression):
+        '''
+        Outputs the result of an expression.
+
+        Parameters
+        ----------
+        expression : str, tuple or list
+            an attribute key or an expression
+
+        Returns
+        -------
+        ValueMatrix or Value
+        '''
+
+        expression = normalize_expression(expression)
+
+        if not isinstance(expression, (str, tuple)):
+            return expression
+
+        if expression in self.cache:
+            recorder.count('metrics.cache_hits')
+            return self.cache[expression]
+
+        with recorder.timer('metrics.evaluate'):
+            if isinstance(expression, str):
+                result = ValueMatrix.from_companies(self.companies, expression, self.years)
+
+            elif expression[0] not in operations:
+                raise ValueError(f'unknown operation: {expression[0]}')
+
+            elif expression[0] == 'value':
+                result = operations['value'](*expression[1:])
+
+            else:
+                operands = [self.evaluate(operand) for operand in expression[1:]]
+                result = operations[expression[0]](*operands)
+
+        self.cache[expression] = result
+
+        return result
+
+    def evaluate_all(self, metrics):
+        '''
+        Outputs the results of named expressions.
+
+        Parameters
+        ----------
+        metrics : dict
+            `dict` mapping names to expressions
+
+        Returns
+        -------
+        results : dict
+            `dict` mapping the names to `ValueMatrix` objects
+        '''
+
+        return {name: self.evaluate(expression) for name, expression in metrics.items()}
+
+    def clear(self):
+        self.cache = {}
+
+
+def normalize_expression(expression):
+    '''
+        Converts an expression into nested tuples (JSON
+        expressions are nested lists), so it can be cached.
+    '''
+
+    if isinstance(expression, list):
+        expression = tuple(expression)
+
+    if isinstance(expression, tuple):
+        return tuple(normalize_expression(operand) for operand in expression)
+
+    elif isinstance(expression, Value):
+        return ('value', expression.value, expression.unit)
+
+    return expression
@@ -0,0 +1,363 @@
+'''
+The content of this module enables us to fetch companies
+in a pipeline of three stages, so that the network link
+and the CPU cores are busy at the same time:
+
+1. fetch: threads send the (batched) api requests and
+   submit the raw dataframes to the parse stage
+2. parse: a pool of processes builds the requests and
+   companies from the dataframes and serializes them
+   with `Company.to_dict`
+3. write: the caller consumes the serialized companies
+   in the order of the identifiers
+
+>>> for identifier, company_dict in run_pipeline(identifiers, batch_size=50, processes=4):
+...     file.write(json.dumps({'identifier': identifier, 'company': company_dict}) + '\\n')
+
+At most `queue_size` batches are in the pipeline at once,
+so memory stays bounded however many identifiers there are.
+The RIC requests of companies with little data (see
+`Company.pending_ric`) are fetched before any new batch.
+'''
+
+from company import company_attributes
+from company.company import Company, get_request_years, get_source_attributes, get_years
+from instrumentation import recorder
+from concurrent.futures import Future, ProcessPoolExecutor
+import multiprocessing
+import queue
+import threading
+
+refinitiv_request_attributes = get_source_attributes(company_attributes, 'refinitiv')
+# priorities of the jobs of the fetch stage (lowest first)
+stop_priority, ric_priority, batch_priority = 0, 1, 2
+
+
+def fetch_batch(batch, batch_size=None, years_back=10, saved_companies=None, rics=None):
+    '''
+    Fetches the dataframes of a batch of identifiers without
+    building any responses (the fetch stage). Identifiers
+    with the same requested years share an api call if
+    `batch_size` is given.
+
+    Parameters
+    ----------
+    batch : list
+        identifiers of the companies
+    batch_size : int
+        `None` to send one request per identifier
+    years_back : int
+        number of consecutive fiscal years to be analyzed
+    saved_companies : dict
+        `dict` mapping identifiers to companies saved in
+        `companies.json`, whose closed fiscal years are
+        not requested again
+    rics : dict
+        `dict` mapping identifiers to RICs to be requested instead
+
+    Returns
+    -------
+    fetched : dict
+        `dict` mapping each identifier to a tuple
+        `(request_identifier, request_years, df)`, where
+        the identifiers of an api call share its dataframe
+    '''
+
+    from refinitiv.request import Request
+
+    saved_companies = saved_companies or {}
+    rics = rics or {}
+    years = get_years(years_back)
+    groups = {}
+    fetched = {}
+
+    for identifier in batch:
+        request_years = get_request_years(years, saved_companies.get(identifier))
+        groups.setdefault(tuple(request_years), []).append(identifier)
+
+    for request_years, identifiers in groups.items():
+        request_identifiers = [rics.get(identifier, identifier) for identifier in identifiers]
+
+        if batch_size is None:
+            dfs = {request_identifier: Request.fetch_df(request_identifier, refinitiv_request_attributes, list(request_years)) \
+                for request_identifier in request_identifiers}
+
+        else:
+            df = Request.fetch_batch_df(request_identifiers, refinitiv_request_attributes, list(request_years))
+            dfs = {request_identifier: df for request_identifier in request_identifiers}
+
+        for identifier, request_identifier in zip(identifiers, request_identifiers):
+            fetched[identifier] = (request_identifier, list(request_years), dfs[request_identifier])
+
+    return fetched
+
+
+def fetch_rics(pending_rics, batch_size=None):
+    '''
+    Fetches the dataframes of the deferred RIC requests of
+    a batch, like `company.company.retry_with_rics`.
+
+    Parameters
+    ----------
+    pending_rics : dict
+        `dict` mapping identifiers to `(ric, request_years)` tuples
+    batch_size : int
+        maximum number of RICs per api call, if `None` all
+        RICs with the same requested years are sent at once
+
+    Returns
+    -------
+    ric_dfs : dict
+        `dict` mapping the identifiers to the dataframes of
+        their RICs (shared by the RICs of an api call)
+    '''
+
+    from refinitiv.request import Request
+
+    groups = {}
+    ric_dfs = {}
+
+    for identifier, (ric, request_years) in pending_rics.items():
+        groups.setdefault(tuple(request_years), []).append(identifier)
+
+    for request_years, identifiers in groups.items():
+        for i in range(0, len(identifiers), batch_size or len(identifiers)):
+            batch = identifiers[i:i+(batch_size or len(identifiers))]
+            df = Request.fetch_batch_df([pending_rics[identifier][0] for identifier in batch], refinitiv_request_attributes, list(request_years))
+            ric_dfs.update({identifier: df for identifier in batch})
+
+    return ric_dfs
+
+
+def build_requests(fetched):
+    '''
+    Builds the request of each identifier from its dataframe,
+    parsing the dataframe of a batched api call once for all
+    of its identifiers (see `Request.from_batch_df`).
+
+    Parameters
+    ----------
+    fetched : dict
+        `dict` mapping identifiers to tuples
+        `(request_identifier, request_years, df)`
+
+    Returns
+    -------
+    requests : dict
+        `dict` mapping the identifiers to `Request` objects
+    '''
+
+    from refinitiv.request import Request
+
+    groups = {}
+    requests = {}
+
+    for identifier, (request_identifier, request_years, df) in fetched.items():
+        group = groups.setdefault((id(df), tuple(request_years)), (df, request_years, {}))
+        group[2][identifier] = request_identifier
+
+    for df, request_years, request_identifiers in groups.values():
+        group_requests = Request.from_batch_df(list(request_identifiers.values()), refinitiv_request_attributes, request_years, df)
+        requests.update({identifier: group_requests[request_identifier] for identifier, request_identifier in request_identifiers.items()})
+
+    return requests
+
+
+def parse_batch(fetched, years_back=10, saved_companies=None, ric_dfs=None):
+    '''
+    Builds the companies of a batch from their dataframes and
+    serializes them (the parse stage). It runs in a worker
+    process, so everything it takes and outputs is picklable.
+
+    Parameters
+    ----------
+    fetched : dict
+        output of `fetch_batch`
+    years_back : int
+        number of consecutive fiscal years to be analyzed
+    saved_companies : dict
+        the saved companies of the batch
+    ric_dfs : dict
+        output of `fetch_rics` for the companies that were
+        waiting for their RIC requests, `None` on the first pass
+
+    Returns
+    -------
+    company_dicts : dict
+        `dict` mapping identifiers to `Company.to_dict()` outputs
+    pending_rics : dict
+        `dict` mapping the identifiers of the companies waiting
+        for a RIC request (left out of `company_dicts`) to
+        `(ric, request_years)` tuples
+    found_rics : dict
+        `dict` mapping the identifiers for which the RIC gave
+        more data to the RIC
+    '''
+
+    saved_companies = saved_companies or {}
+    requests = build_requests(fetched)
+    companies = {}
+    rics = {}
+    company_dicts = {}
+    pending_rics = {}
+    found_rics = {}
+
+    for identifier, (request_identifier, request_years, _) in fetched.items():
+        company = Company(request_identifier, years_back, requests[identifier], saved_companies.get(identifier), defer_ric_retry=True)
+        ric = company.pending_ric
+
+        if ric is not None and ric_dfs is None:
+            pending_rics[identifier] = (ric, request_years)
+            continue
+
+        elif ric is not None:
+            rics[identifier] = (ric, request_years, ric_dfs[identifier])
+
+        companies[identifier] = company
+
+    ric_requests = build_requests(rics)
+
+    for identifier, company in companies.items():
+        if identifier in ric_requests and company.merge_ric_request(ric_requests[identifier]):
+            found_rics[identifier] = rics[identifier][0]
+
+        company_dicts[identifier] = company.to_dict()
+
+    return company_dicts, pending_rics, found_rics
+
+
+def run_pipeline(identifiers, batch_size=None, fetch_workers=4, processes=None, queue_size=64, years_back=10, saved_companies=None, rics=None):
+    '''
+    Fetches, builds and serializes companies in a pipeline
+    (see the module docstring). It is a generator, and the
+    companies are yielded in the order of `identifiers`.
+
+    Parameters
+    ----------
+    identifiers : list
+        unique identifiers of the companies
+    batch_size : int
+        number of identifiers per api call, if `None`
+        one request is sent per identifier
+    fetch_workers : int
+        number of threads sending requests (the shared rate
+        limiter in `refinitiv.api` bounds their request rate)
+    processes : int
+        number of worker processes, if `None` the number of CPUs
+    queue_size : int
+        maximum number of batches in the pipeline at once
+    years_back : int
+        number of consecutive fiscal years to be analyzed
+    saved_companies : dict
+        `dict` mapping identifiers to companies saved in
+        `companies.json` for incremental requests
+    rics : dict
+        `dict` mapping identifiers to RICs to be requested
+        instead, which is updated with the RICs found
+
+    Yields
+    ------
+    identifier : str
+    company_dict : dict
+        `Company.to_dict()` output
+    '''
+
+    saved_companies = saved_companies or {}
+    request_rics = dict(rics or {})
+    batches = [identifiers[i:i+(batch_size or 1)] for i in range(0, len(identifiers), batch_size or 1)]
+    # jobs of the fetch stage, and parse futures in the order they are done (at most two per batch
+    # of the `queue_size` batches in the pipeline, so it is bounded without a maximum size)
+    jobs = queue.PriorityQueue()
+    parsed = queue.Queue()
+    # worker processes are spawned, since forking while the fetch threads hold locks is unsafe
+    parse_executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+
+    def fetch_worker():
+        while True:
+            _, index, fetched, pending_rics = jobs.get()
+
+            if index is None:
+                return
+
+            batch = batches[index]
+            batch_saved_companies = {identifier: saved_companies[identifier] for identifier in batch if identifier in saved_companies}
+
+            try:
+                if pending_rics is None:
+                    with recorder.timer('pipeline.fetch') as info:
+                        fetched = fetch_batch(batch, batch_size, years_back, batch_saved_companies, request_rics)
+                        info['companies'] = len(batch)
+
+                    future = parse_executor.submit(parse_batch, fetched, years_back, batch_saved_companies)
+
+                else:
+                    with recorder.timer('pipeline.fetch_rics') as info:
+                        ric_dfs = fetch_rics(pending_rics, batch_size)
+                        info['companies'] = len(pending_rics)
+
+                    future = parse_executor.submit(parse_batch, fetched, years_back, batch_saved_companies, ric_dfs)
+
+            except Exception as error:
+                future = Future()
+                future.set_exception(error)
+
+            future.add_done_callback(lambda future, index=index, fetched=fetched: parsed.put((index, fetched, future)))
+
+    threads = [threading.Thread(target=fetch_worker, daemon=True) for _ in range(fetch_workers)]
+    # results of the batches that are done, by index, and the companies of the batches waiting for RIC requests
+    done = {}
+    first_passes = {}
+    next_index = 0
+    submitted = 0
+
+    for thread in threads:
+        thread.start()
+
+    try:
+        while next_index < len(batches):
+            while submitted < len(batches) and submitted - next_index < queue_size:
+                jobs.put((batch_priority, submitted, None, None))
+                submitted += 1
+
+            with recorder.timer('pipeline.parse_wait'):
+                index, fetched, future = parsed.get()
+
+            # errors are raised when the batch is next in order
+            if future.exception() is not None:
+                done[index] = future
+
+            else:
+                company_dicts, pending_rics, found_rics = future.result()
+
+                if rics is not None:
+                    rics.update(found_rics)
+
+                # the RIC requests are queued as soon as the batch is parsed, not when it is next in order
+                if len(pending_rics) > 0:
+                    first_passes[index] = company_dicts
+                    jobs.put((ric_priority, index, {identifier: fetched[identifier] for identifier in pending_rics}, pending_rics))
+                    continue
+
+                company_dicts.update(first_passes.pop(index, {}))
+                done[index] = company_dicts
+
+            while next_index in done:
+                company_dicts = done.pop(next_index)
+
+                if isinstance(company_dicts, Future):
+                    company_dicts.result()
+
+                for identifier in batches[next_index]:
+                    yield identifier, company_dicts[identifier]
+
+                recorder.count('pipeline.companies', len(batches[next_index]))
+                next_index += 1
+
+    finally:
+        for i, _ in enumerate(threads):
+            jobs.put((stop_priority, None, None, i))
+
+        for thread in threads:
+            thread.join()
+
+        parse_executor.shutdown(cancel_futures=True)
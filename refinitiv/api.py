@@ -1,7 +1,14 @@
 '''
-This module, when imported, initializes an Eikon app, 
-which enables us to fetch data from the Eikon data api 
-proxy.
+This module enables us to fetch data from the Eikon data 
+api proxy. The Eikon app is initialized on the first 
+request (see `get_backend`), so importing this module 
+does not need the proxy. All requests share the rate limiter `limiter`, 
+which is configured under `"rate_limit"` in 
+`refinitiv/config.json`, and responses are cached 
+on disk by `cache` (configured under `"cache"`). 
+Requests are sent through `backend`, which is the 
+`eikon` module unless replaced with `set_backend` 
+(e.g. by a simulated backend for benchmarks).
 
 The following are names of the parameters that represent 
 geographical revenue:
@@ -13,41 +20,236 @@ geographical revenue:
 >>> fields=['TR.F.GEOExtRev.segmentName', 'TR.F.GEOExtRev']
 '''
 
-import eikon
+from . import config
+from .rate_limit import TokenBucket, get_backoff
+from .cache import ResponseCache
+from instrumentation import recorder
+from concurrent.futures import Future
+import json
+import threading
 from time import sleep
 from numpy import nan
 
-eikon.set_app_key('942784cb18244d7f84c1947c990b63ab5fa491bc')
+app_key = '942784cb18244d7f84c1947c990b63ab5fa491bc'
 
-def get_data(identifier, parameters):
+limiter = TokenBucket(**config['rate_limit'])
+retry = config['retry']
+cache = ResponseCache(**config['cache'])
+# set by `get_backend` on the first request, or by `set_backend`
+backend = None
+backend_lock = threading.Lock()
+# futures of the requests that are being sent, by identifier and parameters
+in_flight = {}
+in_flight_lock = threading.Lock()
+
+def get_data(identifier, parameters, use_cache=True):
+    '''
+    Fetches data from the Eikon data api (see `fetch_data`). 
+    Concurrent calls with the same identifier and parameters 
+    are coalesced: only the first one sends a request, and 
+    the others wait for its response (or exception).
+
+    Parameters
+    ----------
+    identifier : str or list
+        identifier of the company that can be 
+        recognized by the Eikon data api e.g. ISIN, 
+        or a list of such identifiers to fetch in 
+        a single call
+    parameters : list
+        Refinitiv parameters for the request
+    use_cache : bool
+        whether to use the response cache
+
+    Returns
+    -------
+    pandas.DataFrame or None
+        the response the api
+    '''
+
+    key = json.dumps([identifier, parameters])
+
+    with in_flight_lock:
+        future = in_flight.get(key)
+        is_owner = future is None
+
+        if is_owner:
+            future = in_flight[key] = Future()
+
+    if not is_owner:
+        recorder.count('api.coalesced')
+        return future.result()
+
+    try:
+        df = fetch_data(identifier, parameters, use_cache)
+
+    except Exception as error:
+        future.set_exception(error)
+        raise
+
+    else:
+        future.set_result(df)
+        return df
+
+    finally:
+        with in_flight_lock:
+            del in_flight[key]
+
+
+def fetch_data(identifier, parameters, use_cache=True):
     '''
     Fetches data from the Eikon data api. 
-    It sleeps in 0.3 seconds to avoid 
-    overloading the api.
+    It waits for the shared rate limiter to avoid 
+    overloading the api, and retries with a jittered 
+    backoff if the api throttles us or fails transiently.
 
     Parameters
     ----------
-    identifier : str
+    identifier : str or list
         identifier of the company that can be 
-        recognized by the Eikon data api e.g. ISIN
+        recognized by the Eikon data api e.g. ISIN, 
+        or a list of such identifiers to fetch in 
+        a single call
     parameters : list
         Refinitiv parameters for the request
+    use_cache : bool
+        whether to use the response cache
 
     Returns
     -------
     pandas.DataFrame or None
         the response the api
     '''
+
+    if use_cache:
+        df = cache.get(identifier, parameters)
+
+        if df is not None:
+            recorder.count('api.cache_hits')
+            return df
     
-    sleep(0.3)
+    for attempt in range(retry['max_retries']+1):
+        with recorder.timer('api.rate_limit_wait'):
+            limiter.acquire()
+
+        try:
+            with recorder.timer('api.request') as info:
+                df, _ = get_backend().get_data(identifier, parameters)
+                info['rows'], info['columns'] = (0, 0) if df is None else df.shape
+
+        except Exception as error:
+            if attempt == retry['max_retries'] or not is_transient(error):
+                recorder.count('api.errors', error=repr(error))
+                raise
+
+            if is_throttled(error):
+                limiter.throttled()
+                recorder.count('api.throttles')
 
-    df, _ = eikon.get_data(identifier, parameters)
+            recorder.count('api.retries', error=repr(error))
+
+            with recorder.timer('api.backoff'):
+                sleep(get_backoff(attempt, retry['backoff_base'], retry['backoff_max']))
+
+        else:
+            limiter.succeeded()
+            break
     
     if df is None:
+        recorder.count('api.empty_responses')
         return None
 
+    with recorder.timer('api.cleanup'):
+        df = df.fillna(nan).replace([nan], [None])
+
+    if use_cache:
+        cache.set(identifier, parameters, df)
+
+    return df
+
+
+def is_transient(error):
+    '''
+    Checks whether a failed request is worth retrying.
+
+    Parameters
+    ----------
+    error : Exception
+        the exception raised by the request
+
+    Returns
+    -------
+    bool
+    '''
+
+    # `eikon.EikonError`s (and errors of other backends) carry a status code
+    if getattr(error, 'code', None) is not None:
+        return error.code in retry['transient_codes']
+
     else:
-        return df.fillna(nan).replace([nan], [None])
+        return isinstance(error, OSError)
+
+
+def is_throttled(error):
+    '''
+    Checks whether a failed request was throttled by the api.
+
+    Parameters
+    ----------
+    error : Exception
+        the exception raised by the request
+
+    Returns
+    -------
+    bool
+    '''
+
+    return getattr(error, 'code', None) in retry['throttle_codes']
+
+
+def get_backend():
+    '''
+    Outputs the backend that requests are sent through. 
+    If no backend is set, the `eikon` module is imported 
+    and its app is initialized (only once).
+
+    Returns
+    -------
+    Any
+        `eikon` or the backend set with `set_backend`
+    '''
+
+    global backend
+
+    if backend is None:
+        with backend_lock:
+            if backend is None:
+                import eikon
+
+                eikon.set_app_key(app_key)
+                backend = eikon
+
+    return backend
+
+
+def set_backend(new_backend):
+    '''
+    Replaces the backend that requests are sent through.
+
+    Parameters
+    ----------
+    new_backend : Any
+        an object with a `get_data(instruments, fields)` 
+        function that behaves like `eikon.get_data`
+
+    Returns
+    -------
+    None
+    '''
+
+    global backend
+    backend = new_backend
+
 
 if __name__ == '__main__':
     df = get_data('DANSKE.CO', ['TR.F.ProvImpairForLoanLosses', 'TR.F.ProvImpairForLoanLosses.segmentName'])
\ No newline at end of file
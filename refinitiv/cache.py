@@ -0,0 +1,273 @@
+'''
+A module to cache responses from the Eikon data api 
+on disk. Responses are keyed by the identifier and 
+the exact request parameters (including the period 
+string), and stored as compressed pickles.
+'''
+
+from collections import OrderedDict
+from datetime import datetime
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+import time
+import zlib
+
+period_pattern = re.compile(r'FY(\d{4})')
+
+
+class ResponseCache:
+    '''
+    A least recently used cache of api responses on disk.
+
+    ...
+
+    Attributes
+    ----------
+    directory : str
+        directory of the cached responses
+    ttl : dict
+        time to live in seconds of each field type: 
+        `"open_year"`, `"closed_year"` and `"other"`
+    max_bytes : int
+        maximum total size of the cached responses
+    open_fiscal_years : int
+        number of the most recent fiscal years that are 
+        considered open (still subject to change)
+    enabled : bool
+        whether the cache is used at all
+    hits : int
+        number of responses found in the cache
+    misses : int
+        number of responses not found (or expired)
+    
+    Methods
+    -------
+    get(identifier, parameters):
+        outputs a cached response or `None`
+    set(identifier, parameters, df):
+        caches a response
+    get_ttl(parameters):
+        outputs the time to live of a response
+    load_entries():
+        indexes the cached responses on disk
+    stats():
+        outputs the hit/miss counters and the size of the cache
+    clear():
+        removes all cached responses
+    '''
+
+    def __init__(self, directory: str, ttl: dict, max_bytes: int, open_fiscal_years: int=2, enabled: bool=True):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.open_fiscal_years = open_fiscal_years
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # the cached responses on disk are indexed on first use (see `load_entries`)
+        self.entries = None
+        self.size = 0
+
+    def load_entries(self):
+        '''
+        Indexes the cached responses on disk, least 
+        recently used first, if not done yet.
+
+        Returns
+        -------
+        entries : OrderedDict
+            `OrderedDict` mapping paths to sizes in bytes
+        '''
+
+        if self.entries is None:
+            self.entries = OrderedDict()
+
+            if not self.enabled:
+                return self.entries
+
+            os.makedirs(self.directory, exist_ok=True)
+            paths = [os.path.join(self.directory, file_name) for file_name in os.listdir(self.directory) if file_name.endswith('.pkl.z')]
+
+            for path in sorted(paths, key=os.path.getmtime):
+                self.entries[path] = os.path.getsize(path)
+                self.size += self.entries[path]
+
+        return self.entries
+
+    def get_path(self, identifier, parameters):
+        key = hashlib.sha256(json.dumps([identifier, parameters]).encode()).hexdigest()
+
+        return os.path.join(self.directory, key + '.pkl.z')
+
+    def get_ttl(self, parameters):
+        '''
+        Outputs the time to live of a response, which depends 
+        on the most recent fiscal year of the request: 
+        `"open_year"` if it is an open fiscal year, 
+        `"closed_year"` if all the years are closed, and 
+        `"other"` if no field has a period.
+
+        The long `"closed_year"` time to live is only reached 
+        by requests of closed fiscal years alone, which is why 
+        the planner requests the open and the closed years 
+        separately (`"split_open_years"` under `"planner"` in 
+        `refinitiv/config.json`, see `Request.plan`). A request 
+        that includes an open year expires with it, fields 
+        without a period included.
+
+        Parameters
+        ----------
+        parameters : list
+            Refinitiv parameters for the request
+
+        Returns
+        -------
+        int
+            time to live in seconds
+        '''
+
+        years = [int(year) for parameter in parameters for year in period_pattern.findall(parameter)]
+
+        if len(years) == 0:
+            return self.ttl['other']
+
+        elif max(years) >= datetime.now().year - self.open_fiscal_years + 1:
+            return self.ttl['open_year']
+
+        return self.ttl['closed_year']
+
+    def get(self, identifier, parameters):
+        '''
+        Outputs the cached response of a request.
+
+        Parameters
+        ----------
+        identifier : str or list
+            identifier(s) of the request
+        parameters : list
+            Refinitiv parameters for the request
+
+        Returns
+        -------
+        pandas.DataFrame or None
+            the cached response, or `None` if it is 
+            not cached or has expired
+        '''
+
+        if not self.enabled:
+            return None
+
+        path = self.get_path(identifier, parameters)
+
+        # the lock is only held for the index, so reads of different responses run concurrently
+        with self.lock:
+            if path not in self.load_entries():
+                self.misses += 1
+                return None
+
+        try:
+            with open(path, 'rb') as file:
+                created, df = pickle.loads(zlib.decompress(file.read()))
+
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+            with self.lock:
+                self.remove(path)
+                self.misses += 1
+
+            return None
+
+        with self.lock:
+            if time.time() - created > self.get_ttl(parameters):
+                self.remove(path)
+                self.misses += 1
+                return None
+
+            if path in self.entries:
+                self.entries.move_to_end(path)
+
+            self.hits += 1
+
+        try:
+            os.utime(path)
+
+        except OSError:
+            pass
+
+        return df
+
+    def set(self, identifier, parameters, df):
+        '''
+        Caches the response of a request and evicts the least 
+        recently used responses if the cache is too large.
+
+        Parameters
+        ----------
+        identifier : str or list
+            identifier(s) of the request
+        parameters : list
+            Refinitiv parameters for the request
+        df : pandas.DataFrame
+            the response
+
+        Returns
+        -------
+        None
+        '''
+
+        if not self.enabled:
+            return
+
+        path = self.get_path(identifier, parameters)
+        data = zlib.compress(pickle.dumps((time.time(), df), protocol=pickle.HIGHEST_PROTOCOL))
+
+        with self.lock:
+            self.load_entries()
+
+            with open(path + '.tmp', 'wb') as file:
+                file.write(data)
+
+            os.replace(path + '.tmp', path)
+            self.size -= self.entries.pop(path, 0)
+            self.entries[path] = len(data)
+            self.size += len(data)
+
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, path):
+        self.size -= self.entries.pop(path, 0)
+
+        if os.path.exists(path):
+            os.remove(path)
+
+    def stats(self):
+        '''
+        Outputs the hit/miss counters and the size of the cache.
+
+        Returns
+        -------
+        dict
+        '''
+
+        with self.lock:
+            entries = self.load_entries()
+
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(entries), 'bytes': self.size}
+
+    def clear(self):
+        '''
+        Removes all cached responses.
+
+        Returns
+        -------
+        None
+        '''
+
+        with self.lock:
+            for path in list(self.load_entries()):
+                self.remove(path)
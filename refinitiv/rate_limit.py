@@ -0,0 +1,173 @@
+'''
+A module to limit the rate of requests to the 
+Eikon data api proxy. A single `TokenBucket` can 
+be shared between threads and asyncio tasks.
+'''
+
+import asyncio
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    '''
+    An adaptive token bucket. Every request takes a 
+    token, and tokens are refilled at `rate` tokens per 
+    second up to `burst` tokens. When the api throttles 
+    us, the rate is halved, and it slowly recovers to 
+    `requests_per_second` as requests succeed.
+
+    ...
+
+    Attributes
+    ----------
+    max_rate : float
+        the configured number of requests per second
+    min_rate : float
+        the lowest rate that throttling can reduce to
+    rate : float
+        the current number of requests per second
+    burst : int
+        maximum number of tokens in the bucket
+    tokens : float
+        current number of tokens (negative if requests 
+        are queued)
+
+    Methods
+    -------
+    reserve():
+        takes a token and outputs the time to wait for it
+    acquire():
+        blocks until a token is available
+    acquire_async():
+        (coroutine) waits until a token is available
+    throttled():
+        decreases the rate
+    succeeded():
+        increases the rate towards `max_rate`
+    '''
+
+    def __init__(self, requests_per_second: float, burst: int=1, min_requests_per_second: float=None, recovery: float=0.05):
+        '''
+        Parameters
+        ----------
+        requests_per_second : float
+            number of requests per second
+        burst : int
+            maximum number of requests that can be 
+            sent at once
+        min_requests_per_second : float
+            the lowest rate that throttling can reduce 
+            to, defaults to a tenth of `requests_per_second`
+        recovery : float
+            fraction of `requests_per_second` that the rate 
+            is increased by after every successful request
+        '''
+
+        self.max_rate = requests_per_second
+        self.min_rate = min_requests_per_second or requests_per_second/10
+        self.rate = requests_per_second
+        self.burst = burst
+        self.recovery = recovery
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        '''
+        Takes a token from the bucket.
+
+        Returns
+        -------
+        float
+            number of seconds to wait before 
+            the token may be used
+        '''
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now-self.updated)*self.rate)
+            self.updated = now
+            self.tokens -= 1
+
+            if self.tokens >= 0:
+                return 0
+            
+            else:
+                return -self.tokens/self.rate
+
+    def acquire(self):
+        '''
+        Blocks the calling thread until a token is available.
+
+        Returns
+        -------
+        None
+        '''
+
+        wait = self.reserve()
+
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        '''
+        Waits until a token is available without 
+        blocking the event loop.
+
+        Returns
+        -------
+        None
+        '''
+
+        wait = self.reserve()
+
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def throttled(self):
+        '''
+        Halves the rate (but not below `min_rate`).
+
+        Returns
+        -------
+        None
+        '''
+
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate/2)
+
+    def succeeded(self):
+        '''
+        Increases the rate towards `max_rate`.
+
+        Returns
+        -------
+        None
+        '''
+
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate*self.recovery)
+
+
+def get_backoff(attempt, base, maximum):
+    '''
+    Outputs an exponential backoff with full jitter.
+
+    Parameters
+    ----------
+    attempt : int
+        number of failed attempts so far (starting at 0)
+    base : float
+        backoff in seconds after the first failure
+    maximum : float
+        maximum backoff in seconds
+
+    Returns
+    -------
+    float
+        number of seconds to wait
+    '''
+
+    return random.uniform(0, min(maximum, base*2**attempt))
@@ -4,13 +4,21 @@ A module to execute requests to Refinitiv.
 
 from . import config
 from . import api
-from values import Value, ValueList
+from values import Value, ValueList, SegmentMap, get_segment_ids, get_unit
+from instrumentation import recorder
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy
+import pandas
 
 # suffixes of parameter strings
 formattable_period_str = config['formattable_period_str']
 name_str = config['name_str']
 date_str = config['date_str']
 unit_strs = config['unit_strs']
+planner = config['planner']
+# number of parameters (and response columns) of each attribute type
+field_counts = {'other': 1, 'value': 2, 'value_list': 3, 'value_map': 4}
 
 
 class Request:
@@ -28,22 +36,43 @@ class Request:
     years : list
         list of consecutive fiscal years to be fetched
     df : pandas.DataFrame
-        response from the api
+        response from the api (`None` for requests 
+        built from a batch, see `from_batch_df`)
     response : dict
         response in the correct syntax
 
     Methods
     -------
+    plan(attributes, years, max_fields, max_years):
+        (static method) splits a request into sub-requests
+    fetch_df(identifier, attributes, years):
+        (class method) fetches the dataframe of a request
+    fetch_batch_df(identifiers, attributes, years):
+        (class method) fetches the dataframe of several identifiers in a single api call
+    fetch_planned(identifiers, attributes, sub_requests):
+        (static method) fetches sub-requests concurrently and joins their responses
+    from_df(attributes, years, df):
+        (class method) builds a request from an already fetched dataframe
+    from_batch_df(identifiers, attributes, years, df):
+        (class method) builds the requests of several identifiers from the dataframe of a batch
+    batch(identifiers, attributes, years):
+        (class method) fetches several identifiers in a single api call
+    set_df(df):
+        sets the dataframe and builds the response from it
     build_response():
         builds the response `dict`
+    build_responses(identifiers, attributes, years, df):
+        (static method) builds the response `dict`s of a batch at once
     is_mostly_none():
         checks whether the response is mostly empty
     build_parameters(attributes, period_str):
         (static method) builds the request parameters
+    get_year_indices(dates, years):
+        (static method) finds the index in `years` of each date
     get_value_list(values, units, dates, years):
         (static method) produces a `value_list`
     get_value_map(segment_names, values, units, dates, years):
-        (static method) produces a `value_map`
+        (static method) produces a `value_map` (a `SegmentMap`)
     
     '''
 
@@ -62,18 +91,344 @@ class Request:
 
         self.attributes = attributes
         self.years = years
-        period_str = formattable_period_str.format(years[0], years[-1])
-        parameters = self.build_parameters(attributes, period_str)        
-        self.df = api.get_data(identifier, parameters)
+        self.set_df(self.fetch_df(identifier, attributes, years))
+
+    def __eq__(self, request):
+        return self.__dict__ == request.__dict__
+
+    @classmethod
+    def fetch_df(cls, identifier, attributes: dict, years: list):
+        '''
+        Fetches the dataframe of a request without building 
+        the response, in sub-requests if the planner splits it.
+
+        Parameters
+        ----------
+        identifier : str or list
+            identifier of the company, or identifiers 
+            of a batch (see `fetch_batch_df`)
+        attributes : dict
+            subset of the company attributes `backend/config.json` 
+            to be requested
+        years : list
+            list of consecutive fiscal years to be fetched
+
+        Returns
+        -------
+        pandas.DataFrame or None
+            the response from the api
+        '''
+
+        open_years = config['cache']['open_fiscal_years'] if planner['split_open_years'] else None
+        sub_requests = cls.plan(attributes, years, planner['max_fields'], planner['max_years'], open_years)
+
+        if len(sub_requests) == 1:
+            period_str = formattable_period_str.format(years[0], years[-1])
+            parameters = cls.build_parameters(attributes, period_str)
+
+            return api.get_data(identifier, parameters)
+
+        else:
+            return cls.fetch_planned(identifier, attributes, sub_requests)
+
+    @classmethod
+    def fetch_batch_df(cls, identifiers: list, attributes: dict, years: list):
+        '''
+        Fetches the data of all `identifiers` in a single 
+        api call (or a single call per sub-request if the 
+        planner splits it) without building the responses 
+        (see `from_batch_df`).
+
+        Parameters
+        ----------
+        identifiers : list
+            identifiers of the companies
+        attributes : dict
+            subset of the company attributes `backend/config.json` 
+            to be requested
+        years : list
+            list of consecutive fiscal years to be fetched
+
+        Returns
+        -------
+        pandas.DataFrame or None
+            the response from the api, with the rows of 
+            all identifiers
+        '''
+
+        return cls.fetch_df(list(dict.fromkeys(identifiers)), attributes, years)
+
+    @staticmethod
+    def plan(attributes, years, max_fields=None, max_years=None, open_years=None):
+        '''
+        Splits a request into sub-requests of at most `max_fields` 
+        parameters and `max_years` fiscal years. The attributes 
+        without a period (`other` and `value`) are requested once, 
+        and an attribute is never split across sub-requests. If 
+        `open_years` is given, the open and the closed fiscal years 
+        are requested separately, so the responses of closed years 
+        are cached with the long `"closed_year"` time to live (see 
+        `ResponseCache.get_ttl`).
+
+        Parameters
+        ----------
+        attributes : dict
+            subset of the company attributes `backend/config.json` 
+            to be requested
+        years : list
+            list of consecutive fiscal years to be fetched
+        max_fields : int
+            maximum number of parameters per sub-request, 
+            or `None` for no maximum
+        max_years : int
+            maximum number of fiscal years per sub-request, 
+            or `None` for no maximum
+        open_years : int
+            number of the most recent fiscal years that are 
+            open, or `None` to not split at the open years
+
+        Returns
+        -------
+        sub_requests : list
+            `list` of `(attributes, years)` tuples
+        '''
+
+        total_fields = sum(field_counts[attribute['type']] for attribute in attributes.values())
+        max_fields = max_fields or total_fields
+        max_years = max_years or len(years)
+        year_groups = split_open_years(years, open_years)
+        sub_requests = []
+
+        if total_fields <= max_fields and len(years) <= max_years:
+            if len(year_groups) == 1:
+                return [(attributes, years)]
+
+            # the attributes without a period are requested with the open years
+            closed_attributes = {attribute_key: attribute for attribute_key, attribute in attributes.items() if attribute['type'] in ['value_list', 'value_map']}
+
+            return [(attributes, year_groups[0])] + ([(closed_attributes, year_groups[1])] if len(closed_attributes) > 0 else [])
+
+        for types, years_chunks in [(['other', 'value'], [years]), 
+                (['value_list', 'value_map'], [group[i:i+max_years] for group in year_groups for i in range(0, len(group), max_years)])]:
+            chunks = [{}]
+
+            for attribute_key, attribute in attributes.items():
+                if attribute['type'] not in types:
+                    continue
+
+                fields = sum(field_counts[chunk_attribute['type']] for chunk_attribute in chunks[-1].values())
+
+                if len(chunks[-1]) > 0 and fields + field_counts[attribute['type']] > max_fields:
+                    chunks.append({})
+
+                chunks[-1][attribute_key] = attribute
+
+            sub_requests += [(chunk, years_chunk) for chunk in chunks if len(chunk) > 0 for years_chunk in years_chunks]
+
+        return sub_requests or [(attributes, years)]
+
+    @staticmethod
+    def fetch_planned(identifiers, attributes, sub_requests):
+        '''
+        Fetches the sub-requests concurrently and joins their 
+        responses column-wise (and row-wise across fiscal years) 
+        into a single dataframe in the layout of an unsplit 
+        request. The rows of each attribute and instrument are 
+        joined by their position, so batched requests are joined 
+        like single ones. 
+        A sub-request that keeps failing is isolated: its columns 
+        are left empty.
+
+        Parameters
+        ----------
+        identifiers : str or list
+            identifier(s) of the companies
+        attributes : dict
+            attributes of the whole request
+        sub_requests : list
+            `list` of `(attributes, years)` tuples from `plan`
+
+        Returns
+        -------
+        pandas.DataFrame or None
+            the joined response, or `None` if all 
+            sub-requests failed
+        '''
+
+        with ThreadPoolExecutor(max_workers=planner['workers']) as executor:
+            dfs = list(executor.map(lambda sub_request: fetch_sub_request(identifiers, *sub_request), sub_requests))
+
+        if all(df is None for df in dfs):
+            return None
+
+        # a single company has a few rows, which are joined faster without pandas
+        if isinstance(identifiers, str):
+            return join_company_dfs(attributes, sub_requests, dfs)
+
+        blocks = {}
+
+        # the columns of each attribute, with the rows of all its sub-requests (years) stacked
+        for (sub_attributes, _), df in zip(sub_requests, dfs):
+            n = 1
+
+            for attribute_key, attribute in sub_attributes.items():
+                if df is not None:
+                    block = df.iloc[:, [0] + list(range(n, n+field_counts[attribute['type']]))]
+                    blocks.setdefault(attribute_key, []).append(block.set_axis(['instrument'] + \
+                        [(attribute_key, i) for i in range(field_counts[attribute['type']])], axis=1))
+
+                n += field_counts[attribute['type']]
+
+        chunk_dfs = []
+
+        for attribute_blocks in blocks.values():
+            chunk_df = pandas.concat(attribute_blocks, ignore_index=True)
+            chunk_df['row'] = chunk_df.groupby('instrument', sort=False).cumcount()
+            chunk_dfs.append(chunk_df.set_index(['instrument', 'row']))
+
+        columns = [(attribute_key, i) for attribute_key, attribute in attributes.items() for i in range(field_counts[attribute['type']])]
+        df = pandas.concat(chunk_dfs, axis=1).reindex(columns=columns)
+        # the instruments in the order they came in, each with its rows in order
+        instruments = pandas.unique(pandas.concat([chunk_df.index.get_level_values(0).to_series() for chunk_df in chunk_dfs]))
+        df = df.iloc[numpy.lexsort((df.index.get_level_values(1), pandas.Index(instruments).get_indexer(df.index.get_level_values(0))))]
+        df = df.astype(object).where(df.notna(), None)
+        df.insert(0, 'instrument', df.index.get_level_values(0))
+
+        return df.reset_index(drop=True).set_axis(range(df.shape[1]), axis=1)
+
+    @classmethod
+    def from_df(cls, attributes: dict, years: list, df):
+        '''
+        Builds a request from a dataframe that has 
+        already been fetched, without calling the api.
+
+        Parameters
+        ----------
+        attributes : dict
+            subset of the company attributes `backend/config.json` 
+            that were requested
+        years : list
+            list of consecutive fiscal years that were fetched
+        df : pandas.DataFrame or None
+            response from the api for a single identifier
+
+        Returns
+        -------
+        request : Request
+        '''
+
+        request = cls.__new__(cls)
+        request.attributes = attributes
+        request.years = years
+        request.set_df(df)
+
+        return request
+
+    @classmethod
+    def from_batch_df(cls, identifiers: list, attributes: dict, years: list, df):
+        '''
+        Builds the requests of all `identifiers` from the 
+        dataframe of a batched api call. The dataframe is 
+        parsed once for all companies (see `build_responses`) 
+        instead of being split into a dataframe per company.
+
+        Parameters
+        ----------
+        identifiers : list
+            identifiers of the companies
+        attributes : dict
+            subset of the company attributes `backend/config.json` 
+            that were requested
+        years : list
+            list of consecutive fiscal years that were fetched
+        df : pandas.DataFrame or None
+            response from the api with the rows of the identifiers 
+            (rows of other instruments are ignored)
+
+        Returns
+        -------
+        requests : dict
+            `dict` mapping each identifier to its `Request` 
+            (with a `None` response if nothing was found)
+        '''
+
+        identifiers = list(dict.fromkeys(identifiers))
+
+        # the dataframe of a single company has a few rows, which are parsed faster without pandas
+        if len(identifiers) == 1 and df is not None and len(df) > 0 and (df.iloc[:, 0].to_numpy() == df.iloc[0, 0]).all():
+            return {identifiers[0]: cls.from_df(attributes, years, df)}
+
+        if df is None:
+            responses = {}
+
+        else:
+            with recorder.timer('request.build_responses') as info:
+                responses = cls.build_responses(identifiers, attributes, years, df)
+                info['rows'], info['companies'] = len(df), len(identifiers)
+
+        requests = {}
+
+        for identifier in identifiers:
+            request = cls.__new__(cls)
+            request.attributes = attributes
+            request.years = years
+            request.df = None
+            request.response = responses.get(identifier)
+            requests[identifier] = request
+
+        return requests
+
+    @classmethod
+    def batch(cls, identifiers: list, attributes: dict, years: list):
+        '''
+        Fetches the data of all `identifiers` in a single 
+        api call and builds one request per identifier 
+        from the response.
+
+        Parameters
+        ----------
+        identifiers : list
+            identifiers of the companies
+        attributes : dict
+            subset of the company attributes `backend/config.json` 
+            to be requested
+        years : list
+            list of consecutive fiscal years to be fetched
+
+        Returns
+        -------
+        requests : dict
+            `dict` mapping each identifier to its `Request` 
+            (with a `None` response if nothing was found)
+        '''
+
+        df = cls.fetch_batch_df(identifiers, attributes, years)
+
+        return cls.from_batch_df(identifiers, attributes, years, df)
+
+    def set_df(self, df):
+        '''
+        Sets `self.df` and builds the response from it.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame or None
+            response from the api
+
+        Returns
+        -------
+        None
+        '''
+
+        self.df = df
         
         if self.df is None:
             self.response = None
 
         else:
-            self.response = self.build_response()
-
-    def __eq__(self, request):
-        return self.__dict__ == request.__dict__
+            with recorder.timer('request.build_response') as info:
+                self.response = self.build_response()
+                info['rows'] = len(self.df)
 
     def build_response(self):
         '''
@@ -88,26 +443,97 @@ class Request:
 
         n = 1
         response = {}
+        # one list per column, so values are python scalars (not numpy scalars) like the rows of `df.values`
+        columns = [column.tolist() for _, column in self.df.items()]
 
         for attribute_key, attribute in self.attributes.items():
             if attribute['type'] == 'other':
-                response[attribute_key] = self.df.values[0][n]
+                response[attribute_key] = columns[n][0]
                 n += 1
 
             elif attribute['type'] == 'value':
-                response[attribute_key] = Value(self.df.values[0][n], self.df.values[0][n+1])
+                response[attribute_key] = Value(columns[n][0], columns[n+1][0])
                 n += 2
             
             elif attribute['type'] == 'value_list':
-                response[attribute_key] = self.get_value_list(*self.df.values[:,n:n+3].T, self.years)
+                response[attribute_key] = self.get_value_list(*columns[n:n+3], self.years)
                 n += 3
 
             elif attribute['type'] == 'value_map':
-                response[attribute_key] = self.get_value_map(*self.df.values[:,n:n+4].T, self.years)
+                response[attribute_key] = self.get_value_map(*columns[n:n+4], self.years)
                 n += 4
 
         return response
 
+    @staticmethod
+    def build_responses(identifiers, attributes, years, df):
+        '''
+        Builds the response dictionaries of all identifiers 
+        from the dataframe of a batched api call at once: each 
+        column is parsed for the rows of all companies, and the 
+        values are placed in a company x year array before it 
+        is split into the `value_list`s of the companies. 
+        The responses are the same as those of `build_response` 
+        on the dataframe of each company.
+
+        Parameters
+        ----------
+        identifiers : list
+            unique identifiers of the companies
+        attributes : dict
+            subset of the company attributes `backend/config.json` 
+            that were requested
+        years : list
+            list of consecutive fiscal years that were fetched
+        df : pandas.DataFrame
+            response from the api
+
+        Returns
+        -------
+        responses : dict
+            `dict` mapping the identifiers found in 
+            `df` to their responses
+        '''
+
+        codes = pandas.Index(identifiers).get_indexer(df.iloc[:, 0])
+        found, first_rows = numpy.unique(codes, return_index=True)
+        first_rows = first_rows[found >= 0]
+        found = found[found >= 0]
+        responses = {identifiers[code]: {} for code in found}
+        columns = [column.to_numpy(dtype=object) for _, column in df.items()]
+        n = 1
+
+        for attribute_key, attribute in attributes.items():
+            if attribute['type'] == 'other':
+                for code, value in zip(found, columns[n][first_rows].tolist()):
+                    responses[identifiers[code]][attribute_key] = value
+
+                n += 1
+
+            elif attribute['type'] == 'value':
+                for code, value, unit in zip(found, columns[n][first_rows].tolist(), columns[n+1][first_rows].tolist()):
+                    responses[identifiers[code]][attribute_key] = Value(value, unit)
+
+                n += 2
+
+            elif attribute['type'] == 'value_list':
+                value_lists = get_value_lists(codes, *columns[n:n+3], len(identifiers), years)
+
+                for code in found:
+                    responses[identifiers[code]][attribute_key] = value_lists[code]
+
+                n += 3
+
+            elif attribute['type'] == 'value_map':
+                value_maps = get_value_maps(codes, *columns[n:n+4], len(identifiers), years)
+
+                for code in found:
+                    responses[identifiers[code]][attribute_key] = value_maps[code]
+
+                n += 4
+
+        return responses
+
     def is_mostly_none(self):
         '''
         Checks if all `value_list`s only contains `Value(None)`.
@@ -122,7 +548,7 @@ class Request:
 
         for attribute_key, attribute in self.attributes.items():
             if attribute_key in self.response and attribute['type'] == 'value_list':
-                none_lists += all([value.value is None for value in self.response[attribute_key]])
+                none_lists += bool(self.response[attribute_key].missing.all())
                 lists += 1
 
         if lists == none_lists:
@@ -200,14 +626,17 @@ class Request:
             list of consecutive fiscal years
         '''
 
-        output_dict = {year: Value(None) for year in years}
+        indices = Request.get_year_indices(dates, years)
+        # keeps the last row of each year
+        rows = {index: row for row, index in enumerate(indices) if index >= 0}
+        array, missing, integer = parse_values([values[row] for row in rows.values()])
+        year_array = numpy.full(len(years), numpy.nan)
+        year_missing = numpy.ones(len(years), dtype=bool)
+        year_array[list(rows)] = array
+        year_missing[list(rows)] = missing
+        unit = get_unit([Value(None, units[row]) for row in rows.values()])
         
-        for value, unit, date in zip(values, units, dates):
-            if type(date) == str and len(date) >= 4:
-                year = int(date[:4])
-                output_dict[year] = Value(value, unit)
-        
-        return ValueList(output_dict.values())
+        return ValueList.from_arrays(year_array, year_missing, unit, integer)
 
     @staticmethod
     def get_value_map(segment_names, values, units, dates, years):
@@ -229,12 +658,302 @@ class Request:
         years : list
             list of consecutive fiscal years
         '''
-        
-        output_dict = {year: [] for year in years}
-        
-        for segment_name, value, unit, date in zip(segment_names, values, units, dates):
-            if type(date) == str and len(date) >= 4:
-                year = int(date[:4])
-                output_dict[year] += [(segment_name, Value(value, unit))]
 
-        return list(output_dict.values())
\ No newline at end of file
+        indices = Request.get_year_indices(dates, years)
+        rows = [row for row, index in enumerate(indices) if index >= 0]
+        array, missing, integer = parse_values([values[row] for row in rows])
+        segments = get_segment_ids([segment_names[row] for row in rows])
+        unit = get_unit([Value(None, units[row]) for row in rows])
+
+        return SegmentMap.from_arrays(len(years), [indices[row] for row in rows], segments, array, missing, unit, integer)
+
+    @staticmethod
+    def get_year_indices(dates, years):
+        '''
+        Finds the index in `years` of the year of each date 
+        (the first four characters of the date string).
+
+        Parameters
+        ----------
+        dates : list
+            `list` of response dates
+        years : list
+            list of consecutive fiscal years
+
+        Returns
+        -------
+        indices : list
+            index of each date in `years` or -1 if the date 
+            is missing or its year is not in `years`
+        '''
+
+        # plain python, since a company only has a few rows per response
+        year_indices = {year: index for index, year in enumerate(years)}
+
+        return [year_indices.get(int(date[:4]), -1) if isinstance(date, str) and len(date) >= 4 and date[:4].isdecimal() else -1 \
+            for date in dates]
+
+
+def parse_values(values):
+    '''
+    Converts the response values of a `value_list` or
+    `value_map` into floats.
+
+    Parameters
+    ----------
+    values : list
+        `list` of response values
+
+    Returns
+    -------
+    array : numpy.ndarray
+        the values as floats, `nan` if missing
+    missing : numpy.ndarray
+        whether each value is missing (`None` or `nan`)
+    integer : bool
+        whether all values that are not missing are integers
+    '''
+
+    missing = [value is None or value is pandas.NA or value != value for value in values]
+    array = numpy.array([numpy.nan if is_missing else to_float(value) for value, is_missing in zip(values, missing)], dtype=float)
+    integer = all(isinstance(value, (int, numpy.integer)) and not isinstance(value, bool) \
+        for value, is_missing in zip(values, missing) if not is_missing)
+
+    return array, numpy.array(missing, dtype=bool), integer
+
+
+def get_batch_year_indices(dates, years):
+    '''
+    Finds the index in `years` of the year of each date like 
+    `Request.get_year_indices`, vectorized for the many rows 
+    of a batch.
+    '''
+
+    dates = pandas.Series(dates, dtype=object)
+
+    try:
+        prefixes = dates.str[:4]
+
+    # a column without any strings has no `.str` accessor
+    except AttributeError:
+        return numpy.full(len(dates), -1)
+
+    is_year = (dates.str.len() >= 4) & prefixes.str.isdecimal().astype(object).fillna(False).astype(bool)
+    dates_years = pandas.to_numeric(prefixes.where(is_year), errors='coerce')
+
+    return pandas.Index(years).get_indexer(dates_years)
+
+
+def parse_batch_values(values):
+    '''
+    Converts the response values of the rows of a batch into 
+    floats like `parse_values`, but outputs whether each value 
+    is an integer (a row) instead of whether all of them are.
+    '''
+
+    values = pandas.Series(values, dtype=object)
+    array = pandas.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+    missing = values.isna().to_numpy()
+    is_integer = numpy.array([isinstance(value, (int, numpy.integer)) and not isinstance(value, bool) for value in values], dtype=bool)
+
+    return array, missing, is_integer | missing
+
+
+def get_company_units(codes, units):
+    '''
+    Outputs the unit of each company (code) of the rows of a batch 
+    (see `get_unit`), looking at each distinct unit of a company once.
+    '''
+
+    company_units = {}
+    pairs = pandas.DataFrame({'code': codes, 'unit': units}).dropna().drop_duplicates()
+
+    for code, unit in zip(pairs['code'].tolist(), pairs['unit'].tolist()):
+        company_units.setdefault(code, []).append(Value(None, unit))
+
+    return {code: get_unit(unit_values) for code, unit_values in company_units.items()}
+
+
+def get_value_lists(codes, values, units, dates, n_companies, years):
+    '''
+    Converts the rows of a batch into the `value_list` of each 
+    company like `Request.get_value_list`, through a single 
+    company x year array.
+
+    Parameters
+    ----------
+    codes : numpy.ndarray
+        index of the company of each row, -1 for other instruments
+    values : numpy.ndarray
+        response values
+    units : numpy.ndarray
+        response units
+    dates : numpy.ndarray
+        response dates
+    n_companies : int
+        number of companies
+    years : list
+        list of consecutive fiscal years
+
+    Returns
+    -------
+    value_lists : list
+        `ValueList` of each company
+    '''
+
+    indices = get_batch_year_indices(dates, years)
+    rows = numpy.flatnonzero((codes >= 0) & (indices >= 0))
+
+    # keeps the last row of each company and year
+    _, last_rows = numpy.unique((codes[rows]*len(years) + indices[rows])[::-1], return_index=True)
+    rows = rows[::-1][last_rows]
+
+    row_array, row_missing, row_integer = parse_batch_values(values[rows])
+    array = numpy.full((n_companies, len(years)), numpy.nan)
+    missing = numpy.ones((n_companies, len(years)), dtype=bool)
+    array[codes[rows], indices[rows]] = row_array
+    missing[codes[rows], indices[rows]] = row_missing
+    integer = numpy.ones(n_companies, dtype=bool)
+    integer[codes[rows][~row_integer]] = False
+    company_units = get_company_units(codes[rows], units[rows])
+
+    return [ValueList.from_arrays(array[code], missing[code], company_units.get(code), bool(integer[code])) for code in range(n_companies)]
+
+
+def get_value_maps(codes, segment_names, values, units, dates, n_companies, years):
+    '''
+    Converts the rows of a batch into the `value_map` (a 
+    `SegmentMap`) of each company like `Request.get_value_map`.
+
+    Parameters
+    ----------
+    codes : numpy.ndarray
+        index of the company of each row, -1 for other instruments
+    segment_names : numpy.ndarray
+        response segment names
+    values : numpy.ndarray
+        response values
+    units : numpy.ndarray
+        response units
+    dates : numpy.ndarray
+        response dates
+    n_companies : int
+        number of companies
+    years : list
+        list of consecutive fiscal years
+
+    Returns
+    -------
+    value_maps : list
+        `SegmentMap` of each company
+    '''
+
+    indices = get_batch_year_indices(dates, years)
+    rows = numpy.flatnonzero((codes >= 0) & (indices >= 0))
+    # the rows of each company together, in their order
+    rows = rows[numpy.argsort(codes[rows], kind='stable')]
+
+    array, missing, row_integer = parse_batch_values(values[rows])
+    segments = get_segment_ids(segment_names[rows].tolist())
+    company_units = get_company_units(codes[rows], units[rows])
+    bounds = numpy.searchsorted(codes[rows], numpy.arange(n_companies+1))
+    value_maps = []
+
+    for code in range(n_companies):
+        company_rows = slice(bounds[code], bounds[code+1])
+        value_maps.append(SegmentMap.from_arrays(len(years), indices[rows][company_rows], segments[company_rows], \
+            array[company_rows], missing[company_rows], company_units.get(code), bool(row_integer[company_rows].all())))
+
+    return value_maps
+
+
+def to_float(value):
+    try:
+        return float(value)
+
+    except (TypeError, ValueError):
+        return numpy.nan
+
+
+def join_company_dfs(attributes, sub_requests, dfs):
+    '''
+    Joins the responses of the sub-requests of a single company 
+    like `Request.fetch_planned`, with the rows of all sub-requests 
+    of an attribute stacked in its columns.
+    '''
+
+    instrument = next(df.iloc[0, 0] for df in dfs if df is not None and len(df) > 0)
+    columns = {}
+
+    for (sub_attributes, _), df in zip(sub_requests, dfs):
+        n = 1
+
+        for attribute_key, attribute in sub_attributes.items():
+            attribute_columns = columns.setdefault(attribute_key, [[] for _ in range(field_counts[attribute['type']])])
+
+            for i, attribute_column in enumerate(attribute_columns):
+                if df is not None:
+                    attribute_column += df.iloc[:, n+i].tolist()
+
+            n += field_counts[attribute['type']]
+
+    joined_columns = []
+
+    for attribute_key, attribute in attributes.items():
+        joined_columns += columns.get(attribute_key, [[] for _ in range(field_counts[attribute['type']])])
+
+    n_rows = max(len(column) for column in joined_columns)
+
+    return pandas.DataFrame({i: column + [None]*(n_rows-len(column)) for i, column in enumerate([[instrument]*n_rows] + joined_columns)})
+
+
+def split_open_years(years, open_years=None):
+    '''
+    Splits consecutive fiscal years (most recent first) into the 
+    open years and the closed years, leaving out an empty group.
+    '''
+
+    if open_years is None:
+        return [years]
+
+    first_open_year = datetime.now().year - open_years + 1
+
+    return [group for group in [[year for year in years if year >= first_open_year], [year for year in years if year < first_open_year]] \
+        if len(group) > 0]
+
+
+def fetch_sub_request(identifiers, attributes, years):
+    '''
+    Fetches a single sub-request of a planned request 
+    (see `Request.plan`), retrying it `planner["max_retries"]` 
+    times if it fails. An empty response (`None`) is not 
+    retried, since companies without data are common.
+
+    Parameters
+    ----------
+    identifiers : str or list
+        identifier(s) of the companies
+    attributes : dict
+        attributes of the sub-request
+    years : list
+        list of consecutive fiscal years of the sub-request
+
+    Returns
+    -------
+    pandas.DataFrame or None
+        the response, or `None` if the sub-request failed
+    '''
+
+    period_str = formattable_period_str.format(years[0], years[-1])
+    parameters = Request.build_parameters(attributes, period_str)
+
+    for _ in range(planner['max_retries']+1):
+        try:
+            return api.get_data(identifiers, parameters)
+
+        except Exception:
+            recorder.count('request.sub_request_errors')
+
+    recorder.count('request.failed_sub_requests')
+
+    return None
@@ -0,0 +1,211 @@
+'''
+The content of this module enables us to write companies
+in the format of `companies.json` (or as one JSON line per
+company) straight to a file, and to read them back, one
+company at a time, so the nested `dict` of all companies
+is never built:
+
+>>> with open('data/companies.json', 'w', encoding='utf-8') as file:
+...     write_companies(companies, file)
+>>> for identifier, company_dict in iter_companies('data/companies.json'):
+...     ...
+
+JSON is encoded with `orjson` or `ujson` if one of them is
+installed, and with the standard `json` module otherwise.
+'''
+
+import json
+
+try:
+    import orjson
+
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+
+except ImportError:
+    ujson = None
+
+
+def get_dumps(backend=None):
+    '''
+    Outputs a function that encodes an object as a JSON `str`.
+
+    Parameters
+    ----------
+    backend : str
+        `"orjson"`, `"ujson"` or `"json"`, if `None`
+        the fastest one that is installed
+
+    Returns
+    -------
+    dumps : function
+    '''
+
+    if backend is None:
+        backend = 'orjson' if orjson is not None else 'ujson' if ujson is not None else 'json'
+
+    if backend == 'orjson' and orjson is not None:
+        return lambda obj: orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+    elif backend == 'ujson' and ujson is not None:
+        return lambda obj: ujson.dumps(obj, escape_forward_slashes=False)
+
+    elif backend == 'json':
+        return json.dumps
+
+    elif backend in ['orjson', 'ujson']:
+        raise ImportError(f'the json backend {backend} is not installed')
+
+    else:
+        raise ValueError(f'unknown json backend: {backend}')
+
+
+dumps = get_dumps()
+
+
+def write_companies(companies, file, jsonl=False, dumps=dumps):
+    '''
+    Writes companies to a file as a single JSON object in
+    the format of `companies.json`, or as one line
+    `{"identifier": ..., "company": ...}` per company.
+
+    Parameters
+    ----------
+    companies : dict or iterable
+        `dict` mapping identifiers to `Company` objects or to
+        companies in the format of `companies.json`, or an
+        iterable of `(identifier, company)` pairs
+    file : file object
+        file opened for writing text (as UTF-8, since
+        `orjson` and `ujson` do not escape non-ASCII characters)
+    jsonl : bool
+        whether to write one line per company
+    dumps : function
+        JSON encoder (see `get_dumps`)
+
+    Returns
+    -------
+    None
+    '''
+
+    if isinstance(companies, dict):
+        companies = companies.items()
+
+    if not jsonl:
+        file.write('{')
+
+    for i, (identifier, company) in enumerate(companies):
+        company_dict = company if isinstance(company, dict) else company.to_dict()
+
+        if jsonl:
+            file.write(dumps({'identifier': identifier, 'company': company_dict}) + '\n')
+
+        else:
+            file.write((',' if i > 0 else '') + dumps(identifier) + ':' + dumps(company_dict))
+
+    if not jsonl:
+        file.write('}')
+
+
+def iter_jsonl(file):
+    '''
+    Reads a JSONL file one line at a time, skipping the lines
+    that are not valid JSON: the last line of a run that was
+    interrupted may be incomplete.
+
+    Parameters
+    ----------
+    file : file object
+        file opened for reading bytes
+
+    Yields
+    ------
+    offset : int
+        position of the line in the file
+    entry : object
+        the decoded line
+    '''
+
+    offset = 0
+
+    for line in file:
+        try:
+            entry = json.loads(line)
+
+        # incomplete UTF-8 characters raise a `UnicodeDecodeError`, which is a `ValueError` too
+        except ValueError:
+            pass
+
+        else:
+            yield offset, entry
+
+        offset += len(line)
+
+
+def iter_companies(path='data/companies.json', chunk_size=2**20):
+    '''
+    Reads companies written by `write_companies` one at a time,
+    without parsing the whole file.
+
+    Parameters
+    ----------
+    path : str
+        path of a `.json` file in the format of `companies.json`
+        or of a `.jsonl` file with one company per line
+    chunk_size : int
+        number of characters of a `.json` file read at once
+
+    Yields
+    ------
+    identifier : str
+    company_dict : dict
+        the company in the format of `companies.json`
+    '''
+
+    if path.endswith('.jsonl'):
+        with open(path, 'rb') as file:
+            for _, entry in iter_jsonl(file):
+                yield entry['identifier'], entry['company']
+
+        return
+
+    decoder = json.JSONDecoder()
+
+    with open(path, encoding='utf-8') as file:
+        buffer = file.read(chunk_size)
+        end_of_file = len(buffer) == 0
+        position = skip_separators(buffer, 0, '{')
+
+        while True:
+            position = skip_separators(buffer, position, ',')
+
+            if buffer.startswith('}', position):
+                return
+
+            try:
+                identifier, end = decoder.raw_decode(buffer, position)
+                end = skip_separators(buffer, end, ':')
+                company_dict, end = decoder.raw_decode(buffer, end)
+
+            except (json.JSONDecodeError, IndexError):
+                if end_of_file:
+                    raise
+
+                chunk = file.read(chunk_size)
+                end_of_file = len(chunk) == 0
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+
+            yield identifier, company_dict
+            position = end
+
+
+def skip_separators(buffer, position, separator):
+    while position < len(buffer) and (buffer[position].isspace() or buffer[position] == separator):
+        position += 1
+
+    return position
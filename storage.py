@@ -0,0 +1,237 @@
+'''
+The content of this module enables us to store companies
+as a long table with one row per value:
+
+>>> columns == ['company', 'attribute', 'year', 'segment', 'value', 'unit']
+
+in a Parquet or npz file (chosen by the file extension),
+which can be read with column and row filters. The `other`
+attributes (e.g. name and RIC) are stored in a small second
+table `<name>_info.<extension>` with the columns `company`,
+`attribute` and `value` (JSON encoded).
+'''
+
+from company import company_attributes
+import json
+import numpy as np
+import os
+import pandas as pd
+
+columns = ['company', 'attribute', 'year', 'segment', 'value', 'unit']
+info_columns = ['company', 'attribute', 'value']
+# columns stored as integer codes and categories
+categorical_columns = ['company', 'attribute', 'segment', 'unit']
+
+
+def get_table(company_dicts):
+    '''
+    Converts companies in the format of `companies.json` into
+    a long table. Missing values are left out, `segment` is
+    `''` for anything but `value_map`s, and `year` is 0 for
+    `value`s.
+
+    Parameters
+    ----------
+    company_dicts : dict or iterable
+        `dict` mapping identifiers to companies in the
+        format of `companies.json`, or an iterable of
+        `(identifier, company_dict)` pairs (e.g. from
+        `serialization.iter_companies`)
+
+    Returns
+    -------
+    table : pandas.DataFrame
+    info_table : pandas.DataFrame
+    '''
+
+    rows = {column: [] for column in columns}
+    info_rows = {column: [] for column in info_columns}
+
+    def add_row(company, attribute_key, year, segment, value, unit):
+        rows['company'].append(company)
+        rows['attribute'].append(attribute_key)
+        rows['year'].append(year)
+        rows['segment'].append(segment)
+        rows['value'].append(value)
+        rows['unit'].append(unit or '')
+
+    if isinstance(company_dicts, dict):
+        company_dicts = company_dicts.items()
+
+    for identifier, company_dict in company_dicts:
+        years = company_dict['years']['value']
+
+        for attribute_key, attribute in company_attributes.items():
+            if attribute_key not in company_dict:
+                continue
+
+            value = company_dict[attribute_key]['value']
+            unit = company_dict[attribute_key]['unit']
+
+            if attribute['type'] == 'other':
+                info_rows['company'].append(identifier)
+                info_rows['attribute'].append(attribute_key)
+                info_rows['value'].append(json.dumps(value))
+
+            elif attribute['type'] == 'value' and value is not None:
+                add_row(identifier, attribute_key, 0, '', value, unit)
+
+            elif attribute['type'] == 'value_list':
+                for year, year_value in zip(years, value):
+                    if year_value is not None:
+                        add_row(identifier, attribute_key, year, '', year_value, unit)
+
+            elif attribute['type'] == 'value_map':
+                for year, tuples in zip(years, value):
+                    for segment, year_value in tuples:
+                        if year_value is not None:
+                            add_row(identifier, attribute_key, year, segment, year_value, unit)
+
+    table = pd.DataFrame(rows, columns=columns).astype({'year': 'int32', 'value': 'float64'})
+    info_table = pd.DataFrame(info_rows, columns=info_columns)
+
+    for column in categorical_columns:
+        table[column] = table[column].astype('category')
+
+    return table, info_table
+
+
+def save_table(company_dicts, path):
+    '''
+    Saves companies in the format of `companies.json` as
+    a long table in a `.parquet` or `.npz` file.
+
+    Parameters
+    ----------
+    company_dicts : dict or iterable
+        `dict` mapping identifiers to companies in the
+        format of `companies.json`, or an iterable of
+        `(identifier, company_dict)` pairs
+    path : str
+        path of the file
+
+    Returns
+    -------
+    None
+    '''
+
+    table, info_table = get_table(company_dicts)
+    extension = os.path.splitext(path)[1]
+
+    if extension == '.parquet':
+        table.to_parquet(path, index=False)
+        info_table.to_parquet(get_info_path(path), index=False)
+
+    elif extension == '.npz':
+        arrays = {}
+
+        for column in columns:
+            if column in categorical_columns:
+                arrays[column] = table[column].cat.codes.to_numpy()
+                arrays[column + '_categories'] = table[column].cat.categories.to_numpy(dtype=str)
+
+            else:
+                arrays[column] = table[column].to_numpy()
+
+        np.savez(path, **arrays)
+        np.savez(get_info_path(path), **{column: info_table[column].to_numpy(dtype=str) for column in info_columns})
+
+    else:
+        raise ValueError(f'unknown table format: {extension}')
+
+
+def read_table(path, columns=columns, companies=None, attributes=None, years=None):
+    '''
+    Reads a long table saved by `save_table`. Only the
+    requested `columns` and the rows matching the filters
+    are loaded.
+
+    Parameters
+    ----------
+    path : str
+        path of the `.parquet` or `.npz` file
+    columns : list
+        columns to be read
+    companies : list
+        identifiers of the companies to be read, or `None` for all
+    attributes : list
+        attributes to be read, or `None` for all
+    years : list
+        fiscal years to be read, or `None` for all
+
+    Returns
+    -------
+    table : pandas.DataFrame
+    '''
+
+    filters = [(column, 'in', list(values)) for column, values in \
+        [('company', companies), ('attribute', attributes), ('year', years)] if values is not None]
+    extension = os.path.splitext(path)[1]
+
+    if extension == '.parquet':
+        return pd.read_parquet(path, columns=columns, filters=filters or None)
+
+    elif extension == '.npz':
+        # arrays of an npz file are only loaded when they are accessed
+        with np.load(path) as arrays:
+            rows = None
+
+            for column, _, values in filters:
+                if column in categorical_columns:
+                    codes = np.flatnonzero(np.isin(arrays[column + '_categories'], values))
+                    matches = np.isin(arrays[column], codes)
+
+                else:
+                    matches = np.isin(arrays[column], values)
+
+                rows = matches if rows is None else rows & matches
+
+            table = {}
+
+            for column in columns:
+                array = arrays[column] if rows is None else arrays[column][rows]
+
+                if column in categorical_columns:
+                    array = pd.Categorical.from_codes(array, categories=arrays[column + '_categories'])
+
+                table[column] = array
+
+        return pd.DataFrame(table, columns=columns)
+
+    else:
+        raise ValueError(f'unknown table format: {extension}')
+
+
+def read_info_table(path):
+    '''
+    Reads the `other` attributes saved by `save_table`.
+
+    Parameters
+    ----------
+    path : str
+        path of the `.parquet` or `.npz` file of the long table
+
+    Returns
+    -------
+    info_table : pandas.DataFrame
+        with the `value` column decoded from JSON
+    '''
+
+    info_path = get_info_path(path)
+
+    if info_path.endswith('.parquet'):
+        info_table = pd.read_parquet(info_path)
+
+    else:
+        with np.load(info_path) as arrays:
+            info_table = pd.DataFrame({column: arrays[column] for column in info_columns})
+
+    info_table['value'] = info_table['value'].map(json.loads)
+
+    return info_table
+
+
+def get_info_path(path):
+    root, extension = os.path.splitext(path)
+
+    return root + '_info' + extension
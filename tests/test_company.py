@@ -0,0 +1,22 @@
+from company.company import current_year, get_request_years, get_years
+
+
+def get_saved_company(years):
+    return {'error': {'value': False}, 'years': {'value': years}}
+
+
+def test_request_years_of_recent_company():
+    saved_company = get_saved_company(list(range(current_year, current_year-11, -1)))
+
+    assert get_request_years(get_years(10), saved_company, open_years=2) == [current_year, current_year-1]
+
+
+def test_request_years_include_years_open_when_saved():
+    # saved three years ago, when its two most recent years were still open
+    saved_company = get_saved_company(list(range(current_year-3, current_year-14, -1)))
+
+    assert get_request_years(get_years(10), saved_company, open_years=2) == list(range(current_year, current_year-5, -1))
+
+
+def test_request_years_without_saved_company():
+    assert get_request_years(get_years(10)) == get_years(10)
@@ -0,0 +1,42 @@
+from metrics import MetricsEngine, ValueMatrix
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def engine():
+    companies = {
+        'A': {'years': {'value': [2021, 2020]}, 'total_revenues': {'value': [200, 100], 'unit': 'DKK'}},
+        'B': {'years': {'value': [2021, 2020]}, 'total_revenues': {'value': [None, 50], 'unit': 'DKK'}}
+    }
+
+    return MetricsEngine(companies)
+
+
+@pytest.mark.parametrize('expression, swapped', [
+    (('product', ('value', 2), 'total_revenues'), ('product', 'total_revenues', ('value', 2))),
+    (('product', 2, 'total_revenues'), ('product', 'total_revenues', 2)),
+    (('sum', ('value', 1, 'DKK'), 'total_revenues'), ('sum', 'total_revenues', ('value', 1, 'DKK')))
+])
+def test_value_on_the_left(engine, expression, swapped):
+    assert engine.evaluate(expression) == engine.evaluate(swapped)
+
+
+def test_value_on_the_left_units(engine):
+    product = engine.evaluate(('product', ('value', 100, '%'), 'total_revenues'))
+
+    assert product.units.tolist() == ['%*DKK', '%*DKK']
+    assert product.array[0].tolist() == [20000, 10000]
+
+
+def test_reflected_operators(engine):
+    total_revenues = engine.evaluate('total_revenues')
+    difference = engine.evaluate(('difference', ('value', 300, 'DKK'), 'total_revenues'))
+    ratio = 1/total_revenues
+
+    assert isinstance(2*total_revenues, ValueMatrix) and 2*total_revenues == total_revenues*2
+    assert np.array_equal(difference.missing, [[False, False], [True, False]])
+    assert difference.array[0].tolist() == [100, 200] and difference.units.tolist() == ['DKK', 'DKK']
+    assert ratio.array[0].tolist() == [1/200, 1/100] and ratio.units.tolist() == ['1/DKK', '1/DKK']
+    assert engine.evaluate(('ratio', ('value', 1), 'total_revenues')) == ratio
+    assert (3 - total_revenues).missing.all()
@@ -0,0 +1,164 @@
+from company import company_attributes
+from company.company import get_source_attributes, get_years
+from refinitiv import api, request
+from refinitiv.request import Request
+from refinitiv.rate_limit import TokenBucket
+from benchmarks.simulated_eikon import SimulatedEikon
+import pandas as pd
+import pytest
+import re
+
+period_pattern = re.compile(r'\(SDate=FY(\d+),EDate=FY(\d+)[^)]*\)')
+
+
+class DeterministicEikon:
+    '''
+    A backend like `eikon.get_data` whose values only depend 
+    on the instrument, field and fiscal year, so responses of 
+    split and unsplit requests can be compared.
+    '''
+
+    def get_data(self, instruments, fields, **kwargs):
+        instruments = [instruments] if isinstance(instruments, str) else instruments
+        periods = [int(year) for period in period_pattern.findall(''.join(fields)) for year in period] or [0]
+        years = list(range(max(periods), min(periods)-1, -1))
+        rows = []
+
+        for instrument in instruments:
+            for i, year in enumerate(years):
+                row = [instrument]
+
+                for field in fields:
+                    parameter = period_pattern.sub('', field)
+
+                    if period_pattern.search(field) is None:
+                        row.append(f'{instrument} {parameter}' if i == 0 else None)
+
+                    elif parameter.endswith('.periodenddate'):
+                        row.append(f'{year}-12-31')
+
+                    elif parameter.endswith('.currency'):
+                        row.append('DKK')
+
+                    elif parameter.endswith('.segmentName'):
+                        row.append('Denmark')
+
+                    else:
+                        row.append(len(parameter)*10000 + year)
+
+                rows.append(row)
+
+        return pd.DataFrame(rows, columns=['Instrument'] + [f'field {i}' for i in range(len(fields))]), None
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(api.cache, 'enabled', False)
+    monkeypatch.setattr(api, 'backend', DeterministicEikon())
+    monkeypatch.setattr(api, 'limiter', TokenBucket(1e9, burst=10**6))
+
+
+@pytest.mark.parametrize('max_fields, max_years', [(4, None), (None, 3), (3, 4), (1, 1)])
+def test_planned_request_matches_unsplit_request(backend, monkeypatch, max_fields, max_years):
+    monkeypatch.setitem(request.planner, 'split_open_years', False)
+    attributes = get_source_attributes(company_attributes, 'refinitiv')
+    years = get_years(10)
+    unsplit = Request('X.CO', attributes, years)
+
+    monkeypatch.setitem(request.planner, 'max_fields', max_fields)
+    monkeypatch.setitem(request.planner, 'max_years', max_years)
+    assert len(Request.plan(attributes, years, max_fields, max_years)) > 1
+
+    split = Request('X.CO', attributes, years)
+
+    assert split.response == unsplit.response
+
+
+def get_split_requests(attributes, years, df):
+    # the baseline: one dataframe (and request) per company
+    return {instrument: Request.from_df(attributes, years, instrument_df.reset_index(drop=True)) \
+        for instrument, instrument_df in df.groupby(df.columns[0], sort=False)}
+
+
+@pytest.mark.parametrize('backend_class', [DeterministicEikon, SimulatedEikon, lambda: SimulatedEikon(rows_per_year=3)])
+def test_batch_responses_match_company_responses(monkeypatch, backend_class):
+    monkeypatch.setattr(api.cache, 'enabled', False)
+    monkeypatch.setattr(api, 'backend', backend_class())
+    monkeypatch.setattr(api, 'limiter', TokenBucket(1e9, burst=10**6))
+    attributes = get_source_attributes(company_attributes, 'refinitiv')
+    years = get_years(10)
+    identifiers = [f'X{i}.CO' for i in range(20)]
+    df = Request.fetch_batch_df(identifiers, attributes, years)
+    # a duplicated year (the last row wins) and a missing company
+    df = pd.concat([df, df[df.iloc[:, 0] == 'X3.CO'].iloc[:1]], ignore_index=True)
+    requests = Request.from_batch_df(identifiers + ['MISSING.CO'], attributes, years, df)
+    split_requests = get_split_requests(attributes, years, df)
+
+    assert requests['MISSING.CO'].response is None
+
+    for identifier in identifiers:
+        assert requests[identifier].response == split_requests[identifier].response
+
+
+def test_response_scalars_are_python_scalars(backend):
+    attributes = get_source_attributes(company_attributes, 'refinitiv')
+    df = pd.DataFrame({'Instrument': ['X.CO'], **{i: [1] for i in range(sum(request.field_counts[attribute['type']] for attribute in attributes.values()))}})
+    response = Request.from_df(attributes, get_years(10), df).response
+
+    for attribute_key, attribute in attributes.items():
+        if attribute['type'] == 'other':
+            assert type(response[attribute_key]) is int
+
+        elif attribute['type'] == 'value':
+            assert type(response[attribute_key].value) is int
+
+
+@pytest.mark.parametrize('max_fields, max_years', [(4, None), (None, 3), (1, 1)])
+def test_planned_batch_matches_unsplit_batch(backend, monkeypatch, max_fields, max_years):
+    monkeypatch.setitem(request.planner, 'split_open_years', False)
+    attributes = get_source_attributes(company_attributes, 'refinitiv')
+    years = get_years(10)
+    identifiers = [f'X{i}.CO' for i in range(5)]
+    unsplit = Request.batch(identifiers, attributes, years)
+    monkeypatch.setitem(request.planner, 'max_fields', max_fields)
+    monkeypatch.setitem(request.planner, 'max_years', max_years)
+    calls = []
+    get_data = api.get_data
+    monkeypatch.setattr(api, 'get_data', lambda identifiers, parameters: calls.append(identifiers) or get_data(identifiers, parameters))
+    split = Request.batch(identifiers, attributes, years)
+
+    assert calls == [identifiers]*len(Request.plan(attributes, years, max_fields, max_years))
+
+    for identifier in identifiers:
+        assert split[identifier].response == unsplit[identifier].response
+
+
+def test_empty_sub_request_is_not_retried(monkeypatch):
+    calls = []
+
+    def get_data(identifiers, parameters):
+        calls.append(parameters)
+
+    monkeypatch.setattr(api, 'get_data', get_data)
+
+    assert request.fetch_sub_request('X.CO', get_source_attributes(company_attributes, 'refinitiv'), get_years(2)) is None
+    assert len(calls) == 1
+
+
+def test_open_and_closed_years_are_fetched_separately(backend, monkeypatch):
+    attributes = get_source_attributes(company_attributes, 'refinitiv')
+    years = get_years(10)
+    identifiers = ['X.CO', 'Y.CO']
+    monkeypatch.setitem(request.planner, 'split_open_years', False)
+    unsplit = Request.batch(identifiers, attributes, years)
+    monkeypatch.setitem(request.planner, 'split_open_years', True)
+    calls = []
+    get_data = api.get_data
+    monkeypatch.setattr(api, 'get_data', lambda identifiers, parameters: calls.append(parameters) or get_data(identifiers, parameters))
+    split = Request.batch(identifiers, attributes, years)
+    ttls = [api.cache.get_ttl(parameters) for parameters in calls]
+
+    assert ttls == [api.cache.ttl['open_year'], api.cache.ttl['closed_year']]
+
+    for identifier in identifiers:
+        assert split[identifier].response == unsplit[identifier].response
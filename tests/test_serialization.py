@@ -0,0 +1,22 @@
+from serialization import get_dumps, iter_companies, iter_jsonl, write_companies
+import io
+import pytest
+
+companies = {'A.CO': {'name': {'value': 'Łódź Ø'}}, 'B.CO': {'name': {'value': None}}}
+
+
+@pytest.mark.parametrize('jsonl', [False, True])
+@pytest.mark.parametrize('chunk_size', [4, 2**20])
+def test_written_companies_are_read_back(tmp_path, jsonl, chunk_size):
+    path = str(tmp_path / ('companies.jsonl' if jsonl else 'companies.json'))
+
+    with open(path, 'w', encoding='utf-8') as file:
+        write_companies(companies, file, jsonl=jsonl, dumps=get_dumps())
+
+    assert dict(iter_companies(path, chunk_size)) == companies
+
+
+def test_incomplete_lines_are_skipped():
+    lines = [b'{"chunk": "DK"}\n', b'\n', b'{"chunk": "SE"}\n', '{"chunk": "Ø'.encode()[:-1]]
+
+    assert list(iter_jsonl(io.BytesIO(b''.join(lines)))) == [(0, {'chunk': 'DK'}), (len(lines[0]) + 1, {'chunk': 'SE'})]
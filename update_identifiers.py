@@ -1,9 +1,89 @@
-from refinitiv import api
+from refinitiv import api, config
+from instrumentation import recorder
+from serialization import iter_jsonl
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
 import json
+import os
 
-search_string = 'TR.HQCountryCode=DK, TR.HasESGCoverage=False'
-df = api.get_data('SCREEN(U(IN(Equity(active,public,private,primary))), {})'.format(search_string), ['TR.OrganizationID'])
-identifiers = list(df.values[:,1])
+screen = config['screen']
+partial_path = 'data/identifiers.partial.jsonl'
 
-with open('data/identifiers.json', 'w') as file:
-    json.dump(identifiers, file)
\ No newline at end of file
+
+def get_chunk_identifiers(chunk):
+    search_string = '{}={}, {}'.format(screen['chunk_parameter'], chunk, screen['filters'])
+    # screens are not cached, since their results change without a fiscal year to expire with
+    # (transient errors are retried by `refinitiv.api`, and failed chunks by `--resume`)
+    df = api.get_data(screen['formattable_screen_str'].format(search_string), ['TR.OrganizationID'], use_cache=False)
+
+    if df is None:
+        return []
+
+    return [identifier for identifier in df.values[:,1] if identifier is not None]
+
+
+def read_partial(path=partial_path):
+    chunk_identifiers = {}
+
+    if not os.path.exists(path):
+        return chunk_identifiers
+
+    with open(path, 'rb') as file:
+        for _, entry in iter_jsonl(file):
+            chunk_identifiers[entry['chunk']] = entry['identifiers']
+
+    return chunk_identifiers
+
+
+def screen_chunks(chunks, workers=4, resume=False, path=partial_path):
+    chunk_identifiers = read_partial(path) if resume else {}
+    failed_chunks = []
+
+    # the shared rate limiter in `refinitiv.api` bounds the request rate across workers
+    with open(path, 'a' if resume else 'w', encoding='utf-8') as file, ThreadPoolExecutor(max_workers=workers) as executor:
+        # starts on a new line in case the last line of the interrupted run is incomplete
+        if file.tell() > 0:
+            file.write('\n')
+
+        futures = {executor.submit(get_chunk_identifiers, chunk): chunk for chunk in chunks if chunk not in chunk_identifiers}
+
+        for future in as_completed(futures):
+            chunk = futures[future]
+
+            try:
+                identifiers = future.result()
+
+            except Exception as error:
+                recorder.count('screen.failed_chunks', chunk=chunk, error=repr(error))
+                failed_chunks.append(chunk)
+                continue
+
+            chunk_identifiers[chunk] = identifiers
+            file.write(json.dumps({'chunk': chunk, 'identifiers': identifiers}) + '\n')
+            file.flush()
+
+    return chunk_identifiers, failed_chunks
+
+
+def get_unique_identifiers(chunk_identifiers, chunks):
+    identifiers = [identifier for chunk in chunks for identifier in chunk_identifiers.get(chunk, [])]
+
+    return list(dict.fromkeys(identifiers))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', nargs='+', default=screen['chunks'], help='values of the chunk parameter (e.g. country codes) to screen')
+    parser.add_argument('--workers', type=int, default=4, help='number of concurrent screening requests')
+    parser.add_argument('--resume', action='store_true', help='only screen the chunks that are not already in the partial file')
+    args = parser.parse_args()
+
+    chunk_identifiers, failed_chunks = screen_chunks(args.chunks, args.workers, args.resume)
+
+    if len(failed_chunks) > 0:
+        raise SystemExit(f'failed chunks: {failed_chunks} (rerun with --resume to only screen those)')
+
+    with open('data/identifiers.json', 'w', encoding='utf-8') as file:
+        json.dump(get_unique_identifiers(chunk_identifiers, args.chunks), file)
+
+    os.remove(partial_path)
@@ -3,161 +3,539 @@ The content of this module enables us to work
 with values with units.
 '''
 
+from functools import lru_cache
+import numpy as np
+from numpy import nan
+from sys import intern
+import threading
+
 class Value:
     '''
-        Class to represent a simple value with a unit or currency.
+        Class to represent a simple value with a unit or currency. 
+        Units are interned strings, so equal units are usually 
+        the same object and can be compared by identity.
     '''
+
+    __slots__ = ('value', 'unit')
     
     def __init__(self, value, unit=None):
         self.value = value
-        self.unit = unit
+        self.unit = intern(unit) if unit.__class__ is str else unit
 
     def __repr__(self):
         return f'{self.value} {self.unit}'
 
     def __eq__(self, value):
-        return self.__dict__ == value.__dict__
+        return isinstance(value, Value) and self.value == value.value and self.unit == value.unit
+
+    def __getstate__(self):
+        return (self.value, self.unit)
+
+    def __setstate__(self, state):
+        self.value, self.unit = state[0], intern_unit(state[1])
 
     def __add__(self, value):
-        if None in [self.value, value.value]:
-            new_value = None
+        unit = self.unit
 
-        else:
-            new_value = self.value + value.value
+        # interned units are usually identical, which skips the string comparison
+        if unit is not value.unit and unit != value.unit:
+            if unit is None or value.unit is None:
+                return Value(None)
 
-        if self.unit == value.unit:
-            return Value(new_value, self.unit)
-        
-        elif None in [self.unit, value.unit]:
-            return Value(None)
-        
-        else:
-            raise TypeError(f'different units encountered: {[self.unit, value.unit]}')
+            raise TypeError(f'different units encountered: {[unit, value.unit]}')
+
+        if self.value is None or value.value is None:
+            return Value(None, unit)
+
+        return Value(self.value + value.value, unit)
 
     def __sub__(self, value):
-        if None in [self.value, value.value]:
-            new_value = None
+        unit = self.unit
 
-        else:
-            new_value = self.value - value.value
+        if unit is not value.unit and unit != value.unit:
+            if unit is None or value.unit is None:
+                return Value(None)
 
-        if self.unit == value.unit:
-            return Value(new_value, self.unit)
-        
-        elif None in [self.unit, value.unit]:
-            return Value(None)
-        
-        else:
-            raise TypeError(f'different units encountered: {[self.unit, value.unit]}')
+            raise TypeError(f'different units encountered: {[unit, value.unit]}')
+
+        if self.value is None or value.value is None:
+            return Value(None, unit)
+
+        return Value(self.value - value.value, unit)
         
     def __mul__(self, value):
-        if None in [self.value, value.value]:
-            new_value = None
-            new_unit = None
+        if self.value is None or value.value is None:
+            return Value(None)
 
-        else:
-            new_value = self.value * value.value
+        return Value(self.value * value.value, multiply_units(self.unit, value.unit))
+    
+    def __truediv__(self, value):
+        if self.value is None or value.value is None or value.value == 0:
+            return Value(None)
 
-            if self.unit is None and value.unit is None:
-                new_unit = None
+        return Value(self.value / value.value, divide_units(self.unit, value.unit))
 
-            elif self.unit is None:
-                new_unit = value.unit
 
-            elif value.unit is None:
-                new_unit = self.unit
+def intern_unit(unit):
+    '''
+        Interns a unit, so that equal units share a single object.
+    '''
 
-            else:
-                new_unit = f'{self.unit}*{value.unit}'
+    if unit.__class__ is str:
+        return intern(unit)
 
-        return Value(new_value, new_unit)
-    
-    def __truediv__(self, value):
-        if None in [self.value, value.value] or value.value == 0:
-            new_value = None
-            new_unit = None
+    return unit
 
-        else:
-            new_value = self.value / value.value
 
-            if (self.unit is None and value.unit is None) or (self.unit == value.unit):
-                new_unit = None
+def add_units(unit_1, unit_2):
+    '''
+        Outputs the unit of a sum or difference, or `False` if one 
+        of the units is `None` (in which case the result is `Value(None)`).
+    '''
 
-            elif self.unit is None:
-                new_unit = f'1/{value.unit}'
+    if unit_1 is unit_2 or unit_1 == unit_2:
+        return unit_1
 
-            elif value.unit is None:
-                new_unit = self.unit
+    elif unit_1 is None or unit_2 is None:
+        return False
 
-            else:
-                new_unit = self.unit + '/' + value.unit
+    else:
+        raise TypeError(f'different units encountered: {[unit_1, unit_2]}')
 
-        return Value(new_value, new_unit)
+
+@lru_cache(maxsize=None)
+def multiply_units(unit_1, unit_2):
+    '''
+        Outputs the (memoized) unit of a product.
+    '''
+
+    if unit_1 is None:
+        return unit_2
+
+    elif unit_2 is None:
+        return unit_1
+
+    else:
+        return intern(f'{unit_1}*{unit_2}')
+
+
+@lru_cache(maxsize=None)
+def divide_units(unit_1, unit_2):
+    '''
+        Outputs the (memoized) unit of a quotient.
+    '''
+
+    if unit_1 == unit_2:
+        return None
+
+    elif unit_1 is None:
+        return intern(f'1/{unit_2}')
+
+    elif unit_2 is None:
+        return unit_1
+
+    else:
+        return intern(unit_1 + '/' + unit_2)
             
 
 class ValueList:
+    '''
+        Class to represent a list of values with a common unit or currency. 
+        The values are stored columnar in a float64 array next to a mask of 
+        missing values (`Value(None)`), so arithmetic is vectorized. Missing 
+        values carry no unit.
+    '''
+
     def __init__(self, values=[]):
-        self.values = [value for value in values]
+        values = list(values)
+        self.array = np.array([nan if value.value is None else value.value for value in values], dtype=float)
+        self.missing = np.array([value.value is None for value in values], dtype=bool)
+        self.unit = get_unit(values)
+        self.integer = all(isinstance(value.value, (int, np.integer)) for value in values if value.value is not None)
+
+    @classmethod
+    def from_arrays(cls, array, missing, unit=None, integer=False):
+        value_list = cls.__new__(cls)
+        value_list.array = np.asarray(array, dtype=float)
+        value_list.missing = np.asarray(missing, dtype=bool)
+        value_list.unit = intern_unit(unit)
+        value_list.integer = integer
+
+        return value_list
+
+    @classmethod
+    def from_list(cls, values, unit=None):
+        array = np.array(values, dtype=float)
+        missing = np.array([value is None for value in values], dtype=bool)
+        integer = all(isinstance(value, int) for value in values if value is not None)
+
+        return cls.from_arrays(array, missing, unit, integer)
+
+    @property
+    def values(self):
+        return [self.get_value(index) for index in range(len(self))]
 
     def __repr__(self):
         return str(self.values)
 
     def __getitem__(self, index):
-        return self.values[index]
+        if isinstance(index, slice):
+            return [self.get_value(i) for i in range(len(self))[index]]
+
+        return self.get_value(index)
     
     def __setitem__(self, index, value):
         if isinstance(value, Value):
-            self.values[index] = value
+            self.unit = get_unit([Value(None, self.unit), value])
+            self.missing[index] = value.value is None
+            self.array[index] = nan if value.value is None else value.value
+            self.integer = self.integer and (value.value is None or isinstance(value.value, (int, np.integer)))
 
         else:
             raise TypeError(f'can only append Value objects, not {type(value)} objects')
     
     def __eq__(self, value_list):
-        return self.__dict__ == value_list.__dict__
+        return (isinstance(value_list, ValueList) and
+            self.unit == value_list.unit and
+            np.array_equal(self.missing, value_list.missing) and
+            np.array_equal(self.array[~self.missing], value_list.array[~value_list.missing]))
     
     def __len__(self):
-        return len(self.values)
+        return len(self.array)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.get_value(index)
+
+    def get_value(self, index):
+        if self.missing[index]:
+            return Value(None)
+
+        elif self.integer:
+            return Value(int(self.array[index]), self.unit)
+
+        else:
+            return Value(float(self.array[index]), self.unit)
+
+    def to_list(self):
+        values = self.array.astype(object)
+
+        if self.integer:
+            values[~self.missing] = self.array[~self.missing].astype(np.int64).tolist()
+
+        values[self.missing] = None
+
+        return values.tolist()
     
     def append(self, value):
         if isinstance(value, Value):
-            self.values.append(value)
+            self.array = np.append(self.array, nan)
+            self.missing = np.append(self.missing, True)
+            self[-1] = value
 
         else:
             raise TypeError(f'can only append Value objects, not {type(value)} objects')
-        
-    
-    def __add__(self, value_list):
-        new_value_list = ValueList()
 
-        for value_1, value_2 in zip(self.values, value_list.values):
-                new_value_list.append(value_1 + value_2)
+    def align(self, other):
+        '''
+            Converts `other` into a `ValueList` and outputs both lists 
+            cut to the same length (like `zip`).
+        '''
+
+        if isinstance(other, (int, float)):
+            other = Value(other)
+
+        if isinstance(other, Value):
+            other = ValueList([other])
+            other = ValueList.from_arrays(np.repeat(other.array, len(self)), np.repeat(other.missing, len(self)), other.unit, other.integer)
+
+        elif not isinstance(other, ValueList):
+            other = ValueList(other)
+
+        n = min(len(self), len(other))
 
-        return new_value_list
+        return self.array[:n], self.missing[:n], other.array[:n], other.missing[:n], other
+        
+    def __add__(self, value_list):
+        return self.add_or_subtract(value_list, np.add)
     
     def __sub__(self, value_list):
-        new_value_list = ValueList()
+        return self.add_or_subtract(value_list, np.subtract)
+
+    def add_or_subtract(self, value_list, operation):
+        array_1, missing_1, array_2, missing_2, value_list = self.align(value_list)
+        missing = missing_1 | missing_2
+
+        unit = add_units(self.unit, value_list.unit)
 
-        for value_1, value_2 in zip(self.values, value_list.values):
-                new_value_list.append(value_1 - value_2)
+        if unit is False:
+            return ValueList.from_arrays(np.full(len(missing), nan), np.ones(len(missing), dtype=bool))
 
-        return new_value_list
+        with np.errstate(all='ignore'):
+            array = operation(array_1, array_2)
+
+        array[missing] = nan
+
+        return ValueList.from_arrays(array, missing, unit, self.integer and value_list.integer)
     
     def __mul__(self, multiplier):
-        if isinstance(multiplier, int) or isinstance(multiplier, float) or isinstance(multiplier, Value):
-            return ValueList([value*multiplier for value in self.values])
-        
-        elif isinstance(multiplier, list) or isinstance(multiplier, ValueList):
-            return ValueList([value*factor for value, factor in zip(self.values, multiplier)])
+        array_1, missing_1, array_2, missing_2, multiplier = self.align(multiplier)
+        missing = missing_1 | missing_2
+
+        unit = multiply_units(self.unit, multiplier.unit)
+
+        with np.errstate(all='ignore'):
+            array = array_1 * array_2
+
+        array[missing] = nan
+
+        return ValueList.from_arrays(array, missing, unit, self.integer and multiplier.integer)
         
     def __truediv__(self, divisor):
-        if isinstance(divisor, int) or isinstance(divisor, float) or isinstance(divisor, Value):
-            return ValueList([value/divisor for value in self.values])
-        
-        elif isinstance(divisor, list) or isinstance(divisor, ValueList):
-            return ValueList([value/factor for value, factor in zip(self.values, divisor)])
+        array_1, missing_1, array_2, missing_2, divisor = self.align(divisor)
+        missing = missing_1 | missing_2 | (array_2 == 0)
+
+        unit = divide_units(self.unit, divisor.unit)
+
+        with np.errstate(all='ignore'):
+            array = array_1 / array_2
+
+        array[missing] = nan
+
+        return ValueList.from_arrays(array, missing, unit)
+
+
+class SegmentMap:
+    '''
+        Class to represent values of segments (e.g. revenue by geographic 
+        or business segment) over a number of years with a common unit or 
+        currency. The values are stored columnar with one row per segment 
+        and year: the index of the year, the id of the segment name (see 
+        `get_segment_ids`), the value and whether it is missing, so 
+        aggregations are vectorized. Like the `list`s of `(segment_name, Value)` 
+        tuples it replaces, indexing it with a year index outputs such a 
+        `list`. Missing values carry no unit.
+    '''
+
+    def __init__(self, value_map=[]):
+        value_map = [list(tuples) for tuples in value_map]
+        values = [value for tuples in value_map for _, value in tuples]
+        self.length = len(value_map)
+        self.years = np.repeat(np.arange(len(value_map)), [len(tuples) for tuples in value_map])
+        self.segments = get_segment_ids([name for tuples in value_map for name, _ in tuples])
+        self.array = np.array([nan if value.value is None else value.value for value in values], dtype=float)
+        self.missing = np.array([value.value is None for value in values], dtype=bool)
+        self.unit = get_unit(values)
+        self.integer = all(isinstance(value.value, (int, np.integer)) for value in values if value.value is not None)
+
+    @classmethod
+    def from_arrays(cls, length, years, segments, array, missing, unit=None, integer=False):
+        '''
+            Builds a `SegmentMap` of `length` years from its rows, 
+            which are sorted by year (keeping the order of the 
+            segments of each year).
+        '''
+
+        years = np.asarray(years, dtype=np.int64)
+        order = np.argsort(years, kind='stable')
+        segment_map = cls.__new__(cls)
+        segment_map.length = length
+        segment_map.years = years[order]
+        segment_map.segments = np.asarray(segments, dtype=np.int64)[order]
+        segment_map.array = np.asarray(array, dtype=float)[order]
+        segment_map.missing = np.asarray(missing, dtype=bool)[order]
+        segment_map.unit = intern_unit(unit)
+        segment_map.integer = integer
+
+        return segment_map
+
+    @classmethod
+    def from_list(cls, value_map, unit=None):
+        '''
+            Builds a `SegmentMap` from the `value` of a `value_map` 
+            in `companies.json` (a `list` per year of `[segment_name, value]` 
+            pairs).
+        '''
+
+        values = [value for pairs in value_map for _, value in pairs]
+        years = np.repeat(np.arange(len(value_map)), [len(pairs) for pairs in value_map])
+        segments = get_segment_ids([name for pairs in value_map for name, _ in pairs])
+        array = np.array([nan if value is None else value for value in values], dtype=float)
+        missing = np.array([value is None for value in values], dtype=bool)
+        integer = all(isinstance(value, int) for value in values if value is not None)
+
+        return cls.from_arrays(len(value_map), years, segments, array, missing, unit, integer)
+
+    @classmethod
+    def empty(cls, length):
+        return cls.from_arrays(length, [], [], [], [], None, True)
+
+    def __getstate__(self):
+        # segment ids are only valid in this process, so the names are pickled
+        state = self.__dict__.copy()
+        state['segments'] = [segment_names[segment] for segment in self.segments]
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.segments = get_segment_ids(state['segments'])
+        self.unit = intern_unit(self.unit)
+
+    def __repr__(self):
+        return str(list(self))
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __eq__(self, segment_map):
+        return (isinstance(segment_map, SegmentMap) and
+            self.length == segment_map.length and
+            self.unit == segment_map.unit and
+            np.array_equal(self.years, segment_map.years) and
+            np.array_equal(self.segments, segment_map.segments) and
+            np.array_equal(self.missing, segment_map.missing) and
+            np.array_equal(self.array[~self.missing], segment_map.array[~segment_map.missing]))
+
+    def get_rows(self, index):
+        '''
+            Outputs the slice of the rows of the year with the index `index`.
+        '''
+
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError('year index out of range')
+
+        return slice(*np.searchsorted(self.years, [index, index+1]))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self))[index]]
+
+        rows = self.get_rows(index)
+
+        return [(segment_names[segment], self.get_value(row)) for segment, row in \
+            zip(self.segments[rows].tolist(), range(rows.start, rows.stop))]
+
+    def __setitem__(self, index, tuples):
+        rows = self.get_rows(index)
+        year = SegmentMap([tuples])
+        self.unit = get_unit([Value(None, self.unit), Value(None, year.unit)])
+        self.years = np.concatenate([self.years[:rows.start], np.full(len(year.years), index % len(self)), self.years[rows.stop:]])
+        self.segments = np.concatenate([self.segments[:rows.start], year.segments, self.segments[rows.stop:]])
+        self.array = np.concatenate([self.array[:rows.start], year.array, self.array[rows.stop:]])
+        self.missing = np.concatenate([self.missing[:rows.start], year.missing, self.missing[rows.stop:]])
+        self.integer = self.integer and year.integer
+
+    def get_value(self, row):
+        if self.missing[row]:
+            return Value(None)
+
+        elif self.integer:
+            return Value(int(self.array[row]), self.unit)
+
+        else:
+            return Value(float(self.array[row]), self.unit)
+
+    @property
+    def segment_names(self):
+        '''
+            Names of the segments in order of appearance.
+        '''
+
+        _, first_rows = np.unique(self.segments, return_index=True)
+
+        return [segment_names[segment] for segment in self.segments[np.sort(first_rows)].tolist()]
+
+    def sum_by_year(self):
+        '''
+            Outputs the sum of the segments of each year as a `ValueList`, 
+            which is missing for the years without any values.
+        '''
+
+        present = ~self.missing
+        counts = np.bincount(self.years[present], minlength=len(self))
+        array = np.bincount(self.years[present], weights=self.array[present], minlength=len(self)).astype(float)
+        missing = counts == 0
+        array[missing] = nan
+
+        return ValueList.from_arrays(array, missing, self.unit, self.integer)
+
+    def sum_by_segment(self):
+        '''
+            Outputs the values of each segment over the years as a `dict` 
+            mapping segment names to `ValueList`s (summing duplicate rows).
+        '''
+
+        segments, positions = np.unique(self.segments, return_inverse=True)
+        present = ~self.missing
+        cells = positions[present]*len(self) + self.years[present]
+        counts = np.bincount(cells, minlength=len(segments)*len(self)).reshape(len(segments), len(self))
+        array = np.bincount(cells, weights=self.array[present], minlength=len(segments)*len(self)).astype(float).reshape(len(segments), len(self))
+        missing = counts == 0
+        array[missing] = nan
+
+        return {segment_names[segment]: ValueList.from_arrays(array[i], missing[i], self.unit, self.integer) \
+            for i, segment in enumerate(segments.tolist())}
+
+    def to_list(self):
+        '''
+            Outputs the `value` of the `value_map` in `companies.json` 
+            (a `list` per year of `[segment_name, value]` pairs) in linear time.
+        '''
+
+        if self.integer:
+            values = self.array.astype(object)
+            values[~self.missing] = self.array[~self.missing].astype(np.int64).tolist()
+            values = values.tolist()
+
+        else:
+            values = self.array.tolist()
+
+        names = [segment_names[segment] for segment in self.segments.tolist()]
+        missing = self.missing.tolist()
+        bounds = np.searchsorted(self.years, np.arange(len(self)+1)).tolist()
+
+        return [[[names[row], None if missing[row] else values[row]] for row in range(bounds[i], bounds[i+1])] for i in range(len(self))]
+
+
+# interned segment names shared by all `SegmentMap`s, so a name is stored once
+segment_names = []
+segment_ids = {}
+segment_lock = threading.Lock()
+
+
+def get_segment_ids(names):
+    '''
+        Outputs the ids of segment names as an array, 
+        adding the names that have no id yet.
+    '''
+
+    ids = [segment_ids.get(name) for name in names]
+
+    if None in ids:
+        with segment_lock:
+            for i, name in enumerate(names):
+                if ids[i] is None:
+                    ids[i] = segment_ids.get(name)
+
+                    if ids[i] is None:
+                        ids[i] = segment_ids[name] = len(segment_names)
+                        segment_names.append(name)
+
+    return np.array(ids, dtype=np.int64)
 
 
 def get_unit(values):
+    if isinstance(values, (ValueList, SegmentMap)):
+        return values.unit
+
     units = {value.unit for value in values}
 
     if None in units: